@@ -1,3 +1,7 @@
+import numpy as np
+import pandas as pd
+from .event_log import EventLog
+
 def print_by(col, df):
     groups = df.groupby(col)
     for group in groups:
@@ -9,26 +13,66 @@ def filter_evt_attr(log):
 
 
 def aggregate_events(main_evt, sub_evts, log, debug=False):
+    if isinstance(log, EventLog):
+        return __aggregate_events_enc(main_evt, sub_evts, log, debug)
+
     use_log = filter_evt_attr(log) if debug else log
+    before = use_log.copy() if debug else None
 
-    grouped = use_log.groupby('case:concept:name')
-    for _, df in grouped:
-        if debug:
+    # one sort over all matching sub-events: per case, the first (earliest) one is relabeled, the others dropped
+    match_rows = use_log.loc[use_log['concept:name'].isin(sub_evts), [ 'case:concept:name', 'time:timestamp' ]]
+    sorted_rows = match_rows.sort_values(by=[ 'case:concept:name', 'time:timestamp' ], kind='stable')
+    first = ~sorted_rows['case:concept:name'].duplicated()
+
+    use_log.loc[sorted_rows.index[first.to_numpy()], 'concept:name'] = main_evt
+    use_log.drop(sorted_rows.index[~first.to_numpy()], inplace=True)
+
+    if debug:
+        after = use_log.groupby('case:concept:name')
+        for case, df in before.groupby('case:concept:name'):
             print(f"before: {df}")
+            print(f"after: {after.get_group(case)}\n\n")
 
-        match_rows = df.loc[df['concept:name'].isin(sub_evts),:]
-        sorted_rows = match_rows.sort_values(by='time:timestamp')
 
-        update_log = df if debug else use_log
-        update_log.loc[sorted_rows[0:].index, 'concept:name'] = main_evt
-        update_log.drop(sorted_rows[1:].index, inplace=True)
 
-        if debug:
-            print(f"after: {df}\n\n")
+def __aggregate_events_enc(main_evt, sub_evts, log, debug):
+    if debug:
+        # (as for dataframes, debug mode leaves the log untouched)
+        log = log.copy()
+        print(f"before: {log.to_df()}")
 
+    sub_codes = log.activity_codes(sub_evts)
+    main_code = log.activity_code(main_evt)
+
+    # first (earliest) matching sub-event per case is relabeled, the others are dropped
+    match = np.flatnonzero(np.isin(log.activity, sub_codes))
+    match = match[np.lexsort((log.timestamp[match], log.case[match]))]
+    first = np.ones(len(match), dtype=bool)
+    first[1:] = log.case[match][1:] != log.case[match][:-1]
+
+    log.activity[match[first]] = main_code
+    keep = np.ones(len(log), dtype=bool)
+    keep[match[~first]] = False
+    log.keep(keep)
+
+    if debug:
+        print(f"after: {log.to_df()}\n\n")
 
 
 def generalize_events(main_evt, sub_evts, log, debug=False):
+    if isinstance(log, EventLog):
+        if debug:
+            # (as for dataframes, debug mode leaves the log untouched)
+            log = log.copy()
+            print(f"before: {log.to_df()}")
+
+        # pure relabeling on codes
+        log.activity[np.isin(log.activity, log.activity_codes(sub_evts))] = log.activity_code(main_evt)
+
+        if debug:
+            print(f"after: {log.to_df()}\n\n")
+        return
+
     use_log = filter_evt_attr(log) if debug else log
     
     if debug:
@@ -38,4 +82,137 @@ def generalize_events(main_evt, sub_evts, log, debug=False):
             generalize_events(main_evt, sub_evts, df, False)
             print(f"after: {df}\n\n")
     else:
-        use_log.loc[use_log['concept:name'].isin(sub_evts), 'concept:name'] = main_evt
\ No newline at end of file
+        use_log.loc[use_log['concept:name'].isin(sub_evts), 'concept:name'] = main_evt
+
+
+RULE_KINDS = [ 'aggregate', 'generalize' ]
+
+# rules: ordered rule table; list of ('aggregate' | 'generalize', main_evt, sub_evts),
+# or dataframe with columns kind, main, subs; same result as calling aggregate_events / generalize_events
+# for each rule in order, but compiled and applied in a single sort + vectorized pass (in-place)
+# report: also return the nr. of events each rule touched (see CompiledRules.apply)
+def abstract_log(log, rules, report=False):
+    if isinstance(log, EventLog):
+        codes, vocab, case, ts = log.activity, log.activities, log.case, log.timestamp
+    else:
+        codes, vocab = pd.factorize(log['concept:name'])
+        case, _ = pd.factorize(log['case:concept:name'])
+        ts = pd.to_datetime(log['time:timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    compiled = compile_rules(rules, vocab)
+    new_codes, keep, touched = compiled.apply(codes, case, ts)
+
+    if isinstance(log, EventLog):
+        log.activities = compiled.activities
+        log.activity = new_codes.astype(np.int32)
+        log.keep(keep)
+    else:
+        log['concept:name'] = compiled.activities[new_codes]
+        log.drop(log.index[~keep], inplace=True)
+
+    return (log, touched) if report else log
+
+def canonical_rules(rules):
+    # rule table as list of [ kind, main, sorted subs ] (e.g., for hashing; independent of dataframe repr or set order)
+    if isinstance(rules, pd.DataFrame):
+        rules = rules[[ 'kind', 'main', 'subs' ]].itertuples(index=False, name=None)
+
+    return [ [ kind, main_evt, sorted(sub_evts) ] for kind, main_evt, sub_evts in rules ]
+
+def compile_rules(rules, activities):
+    """
+    Compile an ordered rule table into a code -> code mapping plus one aggregation mask per aggregate rule.
+
+    Parameters
+    -----------------
+    rules
+        list of (kind, main_evt, sub_evts) or dataframe with columns kind, main, subs
+    activities
+        activity vocabulary (code -> label) of the log the rules will be applied to
+
+    Returns
+    -----------------
+    CompiledRules
+    """
+
+    if isinstance(rules, pd.DataFrame):
+        rules = list(rules[[ 'kind', 'main', 'subs' ]].itertuples(index=False, name=None))
+
+    vocab = list(activities)
+    code_of = { label: code for code, label in enumerate(vocab) }
+    # original code -> code after the rules so far
+    label_map = np.arange(len(vocab))
+    rule_masks = []
+    for kind, main_evt, sub_evts in rules:
+        if kind not in RULE_KINDS:
+            raise ValueError(f"unknown abstraction rule '{kind}' (expected one of {RULE_KINDS})")
+
+        if main_evt not in code_of:
+            code_of[main_evt] = len(vocab)
+            vocab.append(main_evt)
+        is_sub = np.isin(np.asarray(vocab, dtype=object), list(sub_evts))
+
+        # events (by original code) matched by this rule, given all rules before it
+        # (an aggregation's kept event is relabeled to main_evt, just like a generalization)
+        mask = is_sub[label_map]
+        rule_masks.append(mask)
+        label_map = np.where(mask, code_of[main_evt], label_map)
+
+    return CompiledRules(rules, np.asarray(vocab, dtype=object), label_map, rule_masks)
+
+
+class CompiledRules:
+
+    def __init__(self, rules, activities, label_map, rule_masks):
+        self.rules = rules
+        # extended vocabulary (incl. main events)
+        self.activities = activities
+        self.label_map = label_map
+        self.rule_masks = rule_masks
+
+    def apply(self, codes, case, ts):
+        """
+        Apply the rules to a log given as (original activity codes, case codes, timestamps).
+        Per aggregate rule, among the events it matches in a case only the first survives; taking the first over
+        all events matched by the mapping (incl. those dropped by earlier rules) gives the same event,
+        since an earlier rule only drops events after the one it keeps, under the same label.
+
+        Returns
+        -----------------
+        (new activity codes, keep mask, dataframe with per rule: kind, main, touched, dropped)
+        """
+
+        codes = np.asarray(codes)
+        case = np.asarray(case)
+        # single stable sort on (case, timestamp)
+        order = np.lexsort((ts, case))
+        sorted_case = case[order]
+        sorted_codes = codes[order]
+
+        # index of rule that dropped the event (len(rules) = not dropped)
+        num_rules = len(self.rules)
+        drop_at = np.full(len(codes), num_rules)
+        touched = []
+        for index, ((kind, main_evt, _), mask) in enumerate(zip(self.rules, self.rule_masks)):
+            matched = np.flatnonzero(mask[sorted_codes])
+            # (only count events still in the log at this rule)
+            alive = drop_at[order[matched]] > index
+            touched.append(int(alive.sum()))
+
+            if kind == 'aggregate':
+                matched_case = sorted_case[matched]
+                first = np.ones(len(matched), dtype=bool)
+                first[1:] = matched_case[1:] != matched_case[:-1]
+                dropped = order[matched[~first]]
+                drop_at[dropped] = np.minimum(drop_at[dropped], index)
+
+        keep = drop_at == num_rules
+        dropped_by = np.bincount(drop_at[~keep], minlength=num_rules)[:num_rules]
+        report = pd.DataFrame({
+            'kind': [ rule[0] for rule in self.rules ],
+            'main': [ rule[1] for rule in self.rules ],
+            'touched': touched,
+            'dropped': dropped_by
+        })
+
+        return self.label_map[codes], keep, report
@@ -0,0 +1,120 @@
+import os
+import glob
+import json
+import pickle
+import hashlib
+
+class AlignmentCache:
+    """
+    On-disk cache of alignments, stored as pickle files.
+    Entries are keyed by a fingerprint of the model (Petri net structure, markings & cost functions)
+    plus the aligned activity sequence, so alignments of a variant are reused across runs
+    as long as the normative model is unchanged.
+    Least recently used entries are evicted once the cache exceeds max_bytes.
+
+    Parameters
+    -----------------
+    cache_dir
+        directory holding the cache entries (created if needed)
+    max_bytes
+        maximum total size of the cache entries
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024**2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        # (running total; only re-scanned when exceeding max_bytes)
+        self.__total = self.size()
+
+    def fingerprint(self, net, im, fm, model_cost_function, sync_cost_function, **params):
+        # stable hash of the model; params: other settings affecting the alignment (e.g., filter_invis)
+        # (transitions are described by label, costs and connected places: names of invisible transitions
+        # are generated anew on each BPMN conversion)
+        model = {
+            'transitions': sorted([ [ t.label, model_cost_function.get(t), sync_cost_function.get(t),
+                                    sorted([ a.source.name, a.weight ] for a in t.in_arcs),
+                                    sorted([ a.target.name, a.weight ] for a in t.out_arcs) ] for t in net.transitions ], key=str),
+            'places': sorted(p.name for p in net.places),
+            'im': sorted([ p.name, n ] for p, n in im.items()),
+            'fm': sorted([ p.name, n ] for p, n in fm.items()),
+            'params': params
+        }
+        return hashlib.sha256(json.dumps(model, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    def key(self, fingerprint, sequence):
+        # <model fingerprint>-<hash of activity sequence>
+        return f"{fingerprint}-{hashlib.sha256(json.dumps(list(sequence)).encode()).hexdigest()[:32]}"
+
+    def get(self, key):
+        entry = self.__entry_path(key)
+        if not os.path.exists(entry):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # (mark as recently used)
+        os.utime(entry)
+        with open(entry, 'rb') as file:
+            return pickle.load(file)
+
+    def put(self, key, alignment):
+        entry = self.__entry_path(key)
+        old_size = os.path.getsize(entry) if os.path.exists(entry) else 0
+        with open(entry + ".tmp", 'wb') as file:
+            pickle.dump(alignment, file)
+        os.replace(entry + ".tmp", entry)
+
+        self.__total += os.path.getsize(entry) - old_size
+        if self.__total > self.max_bytes:
+            self.__evict()
+
+    def get_or_align(self, key, align_fn):
+        alignment = self.get(key)
+        if alignment is None:
+            alignment = align_fn()
+            self.put(key, alignment)
+        return alignment
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return { 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups > 0 else float('nan'),
+                 'entries': len(self.__entries()), 'bytes': self.size() }
+
+    def invalidate(self, fingerprint=None, key=None):
+        # remove entries of given model (any sequence) or with given key; if neither given, clear the cache
+        if key is not None:
+            pattern = key
+        elif fingerprint is not None:
+            pattern = f"{fingerprint}-*"
+        else:
+            pattern = "*"
+
+        for entry in glob.glob(os.path.join(self.cache_dir, pattern + ".pkl")):
+            os.remove(entry)
+        self.__total = self.size()
+
+    def clear(self):
+        self.invalidate()
+
+    def size(self):
+        return sum(os.path.getsize(entry) for entry in self.__entries())
+
+    def __entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def __entries(self):
+        return glob.glob(os.path.join(self.cache_dir, "*.pkl"))
+
+    def __evict(self):
+        entries = [ (os.path.getmtime(entry), os.path.getsize(entry), entry) for entry in self.__entries() ]
+        total = sum(size for _, size, _ in entries)
+        # least recently used first
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(entry)
+            total -= size
+        self.__total = total
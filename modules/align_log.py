@@ -2,50 +2,447 @@
 # https://github.com/process-intelligence-solutions/pm4py/blob/release/examples/alignment_test.py
 
 import os
+import time
+from collections import deque
 
 from pm4py import util
 from pm4py.algo.conformance import alignments as ali
 from pm4py.algo.conformance.alignments.petri_net.variants.state_equation_a_star import Parameters
+from pm4py.algo.conformance.alignments.petri_net.variants.approx_sliding_window import Parameters as SlidingWindowParameters
 from pm4py.objects import log as log_lib
 from pm4py.objects.conversion.bpmn import converter as bpmn_converter
 
-def align_trace(trace, net, im, fm, model_cost_function, sync_cost_function, filter_invis=False):
-    trace_costs = list(map(lambda e: 1000, trace))
+# cost of a log move or a move on a visible model transition (sync moves & invisible moves cost 0)
+MOVE_COST = 1000
+
+def align_trace(trace, net, im, fm, model_cost_function, sync_cost_function, filter_invis=False, max_time=None):
+    # max_time: time budget (seconds); None if exceeded
+    params = __align_params(trace, model_cost_function, sync_cost_function)
+    if max_time is not None:
+        params[Parameters.PARAM_MAX_ALIGN_TIME_TRACE] = max_time
+    alignment = ali.petri_net.algorithm.apply_trace(trace, net, im, fm, parameters=params,
+                                   variant=ali.petri_net.algorithm.VERSION_STATE_EQUATION_A_STAR)
+    if filter_invis and alignment is not None:
+        alignment['alignment'] = filter_invis_steps(alignment['alignment'])
+    
+    return alignment
+
+def approx_align_trace(trace, net, im, fm, model_cost_function, sync_cost_function, filter_invis=False, max_time=None, max_expansions=100000):
+    # approximate alignment (pm4py's sliding window search: optimal per window of events, bounded nr. of expanded states);
+    # None if no alignment was found within budget
+    params = __align_params(trace, model_cost_function, sync_cost_function)
+    params[SlidingWindowParameters.MAX_EXPANSIONS] = max_expansions
+    if max_time is not None:
+        params[SlidingWindowParameters.PARAM_MAX_ALIGN_TIME_TRACE] = max_time
+    alignment = ali.petri_net.algorithm.apply_trace(trace, net, im, fm, parameters=params,
+                                   variant=ali.petri_net.algorithm.APPROX_SLIDING_WINDOW)
+    if filter_invis and alignment is not None:
+        alignment['alignment'] = filter_invis_steps(alignment['alignment'])
+
+    return alignment
+
+def replay_net(net, im, fm):
+    # net compiled for replay_trace: markings as tuples of token counts per place,
+    # transitions as (input (place index, weight) pairs, output pairs), by label / invisible
+    place_index = { place: i for i, place in enumerate(net.places) }
+    to_marking = lambda marking: tuple(marking.get(place, 0) for place in place_index)
+    by_label = {}
+    invisible = []
+    for t in net.transitions:
+        arcs = (tuple((place_index[a.source], a.weight) for a in t.in_arcs), tuple((place_index[a.target], a.weight) for a in t.out_arcs))
+        if t.label is None:
+            invisible.append(arcs)
+        else:
+            by_label.setdefault(t.label, []).append(arcs)
+
+    return { 'by_label': by_label, 'invisible': invisible, 'im': to_marking(im), 'fm': to_marking(fm) }
+
+def replay_trace(trace, replay, max_markings=10000):
+    """
+    Alignment steps of a perfectly fitting trace, found by a label-driven walk over the reachable markings
+    (per event, fire an enabled transition with its label; in between, any sequence of invisible transitions).
+    replay: see replay_net.
+    Returns None if the trace doesn't fit, or if more than max_markings markings are reached at any point.
+    """
+
+    # marking -> (previous node, step); steps are recovered by following the previous nodes
+    frontier = __invisible_closure({ replay['im']: None }, replay['invisible'], max_markings)
+    for event in trace:
+        if frontier is None:
+            return None
+        label = event[log_lib.util.xes.DEFAULT_NAME_KEY]
+        fired = {}
+        for marking, node in frontier.items():
+            for arcs in replay['by_label'].get(label, ()):
+                reached = __fire(marking, arcs)
+                if reached is not None and reached not in fired:
+                    fired[reached] = (node, (label, label))
+        if len(fired) == 0:
+            return None
+        frontier = __invisible_closure(fired, replay['invisible'], max_markings)
+
+    if frontier is None or replay['fm'] not in frontier:
+        return None
+    steps = []
+    node = frontier[replay['fm']]
+    while node is not None:
+        node, step = node
+        steps.append(step)
+    return steps[::-1]
+
+def shortest_model_path(replay):
+    """
+    Steps (('>>', label) model moves; ('>>', None) for invisible transitions) of a cheapest path
+    from initial to final marking, i.e. with the fewest visible transitions (0-1 breadth-first search).
+    replay: see replay_net. Returns None if the final marking isn't reachable.
+    """
+
+    moves = [ (arcs, 1, label) for label, arcs_list in replay['by_label'].items() for arcs in arcs_list ]
+    moves += [ (arcs, 0, None) for arcs in replay['invisible'] ]
+
+    # marking -> (cost, (previous node, step))
+    best = { replay['im']: (0, None) }
+    queue = deque([ replay['im'] ])
+    while len(queue) > 0:
+        marking = queue.popleft()
+        cost, node = best[marking]
+        if marking == replay['fm']:
+            steps = []
+            while node is not None:
+                node, step = node
+                steps.append(step)
+            return steps[::-1]
+
+        for arcs, move_cost, label in moves:
+            reached = __fire(marking, arcs)
+            if reached is not None and (reached not in best or best[reached][0] > cost + move_cost):
+                best[reached] = (cost + move_cost, (node, ('>>', label)))
+                if move_cost == 0:
+                    queue.appendleft(reached)
+                else:
+                    queue.append(reached)
+
+    return None
+
+def __invisible_closure(frontier, invisible, max_markings):
+    # (breadth-first, so each marking is reached with the fewest invisible steps)
+    closure = dict(frontier)
+    queue = list(frontier.keys())
+    while len(queue) > 0:
+        next_queue = []
+        for marking in queue:
+            for arcs in invisible:
+                reached = __fire(marking, arcs)
+                if reached is not None and reached not in closure:
+                    closure[reached] = (closure[marking], ('>>', None))
+                    next_queue.append(reached)
+        if len(closure) > max_markings:
+            return None
+        queue = next_queue
+
+    return closure
+
+def __fire(marking, arcs):
+    # marking after firing the transition (None if not enabled)
+    inputs, outputs = arcs
+    for i, weight in inputs:
+        if marking[i] < weight:
+            return None
+
+    reached = list(marking)
+    for i, weight in inputs:
+        reached[i] -= weight
+    for i, weight in outputs:
+        reached[i] += weight
+    return tuple(reached)
+
+def __align_params(trace, model_cost_function, sync_cost_function):
+    trace_costs = list(map(lambda e: MOVE_COST, trace))
     params = dict()
     params[util.constants.PARAMETER_CONSTANT_ACTIVITY_KEY] = log_lib.util.xes.DEFAULT_NAME_KEY
     params[Parameters.PARAM_MODEL_COST_FUNCTION] = model_cost_function
     params[Parameters.PARAM_TRACE_COST_FUNCTION] = trace_costs
     params[Parameters.PARAM_SYNC_COST_FUNCTION] = sync_cost_function
-    alignment = ali.petri_net.algorithm.apply_trace(trace, net, im, fm, parameters=params,
-                                   variant=ali.petri_net.algorithm.VERSION_STATE_EQUATION_A_STAR)
-    if filter_invis:
-        alignment['alignment'] = [ (trace_step, model_step) for trace_step, model_step in alignment['alignment'] if not (trace_step=='>>' and model_step is None) ]
-    
-    return alignment
 
-def __cost_functions(net):
+    return params
+
+def filter_invis_steps(steps):
+    return [ (trace_step, model_step) for trace_step, model_step in steps if not (trace_step=='>>' and model_step is None) ]
+
+def cost_functions(net):
     model_cost_function = {}
     sync_cost_function = {}
     for t in net.transitions:
         if t.label is not None:
-            model_cost_function[t] = 1000
+            model_cost_function[t] = MOVE_COST
             sync_cost_function[t] = 0
         else:
             model_cost_function[t] = 0 # updated (invis transits should cost 0)
     
     return model_cost_function, sync_cost_function
 
-def align_bpmn_log(bpmn, log, filter_invis=False):
-    net, marking, fmarking = bpmn_converter.apply(bpmn)
-    model_cost_function, sync_cost_function = __cost_functions(net)
 
-    return [ align_trace(trace, net, marking, fmarking, model_cost_function, sync_cost_function, filter_invis) for trace in log ]
+class AlignmentModel:
+    """
+    Normative BPMN model prepared for alignment: converted to a Petri net (with initial & final marking)
+    and cost functions once, so aligning a trace only costs the search itself.
+    (the state equation of pm4py's A* aligner is built on the synchronous product with each trace,
+    so it cannot be precomputed per model)
 
-def align_bpmn_trace(bpmn, trace, filter_invis=False):
-    net, marking, fmarking = bpmn_converter.apply(bpmn)
-    model_cost_function, sync_cost_function = __cost_functions(net)
-    
-    return align_trace(trace, net, marking, fmarking, model_cost_function, sync_cost_function, filter_invis)
+    Exact alignment can be bounded per trace by a time budget and a maximum trace length;
+    traces exceeding either are aligned approximately instead (see approx_align_trace).
+    If the approximate search runs out of budget as well, the trace is aligned as all log moves
+    followed by a cheapest path through the model (see shortest_model_path), which can't fail.
+    So, the worst case per trace is 2 x max_time. Each alignment is flagged with 'exact' (True/False).
+
+    Parameters
+    -----------------
+    bpmn
+        normative BPMN model
+    filter_invis
+        leave out moves on invisible transitions (see align_trace)
+    cache
+        (optional) AlignmentCache; variants aligned before against the same model are not re-aligned
+        (only exact alignments are cached)
+    max_time
+        time budget (seconds) per trace, for the exact search and (again) for the approximate fallback
+    max_length
+        traces with more events are not aligned exactly, but approximately right away
+    max_expansions
+        bound on the nr. of expanded states of the approximate search
+    replay
+        first try to replay the trace on the net (see replay_trace); perfectly fitting traces then skip the A* search
+        (each alignment records its 'path': 'replay', 'astar', 'approx' or 'fallback')
+    """
+
+    def __init__(self, bpmn, filter_invis=False, cache=None, max_time=None, max_length=None, max_expansions=100000, replay=True):
+        self.net, self.im, self.fm = bpmn_converter.apply(bpmn)
+        self.model_cost_function, self.sync_cost_function = cost_functions(self.net)
+        self.filter_invis = filter_invis
+        self.cache = cache
+        self.fingerprint = cache.fingerprint(self.net, self.im, self.fm, self.model_cost_function, self.sync_cost_function,
+                                             filter_invis=filter_invis) if cache is not None else None
+        self.max_time = max_time
+        self.max_length = max_length
+        self.max_expansions = max_expansions
+        self.replay = replay
+        self.replay_net = replay_net(self.net, self.im, self.fm)
+        # (cheapest path through the model; also gives the best worst cost, i.e. the cost of aligning an empty trace)
+        self.model_path = shortest_model_path(self.replay_net)
+        if self.model_path is None:
+            raise ValueError("final marking of the model is not reachable from its initial marking; cannot align")
+        self.best_worst_cost = MOVE_COST * sum(1 for _, label in self.model_path if label is not None)
+
+    def align(self, trace):
+        if self.cache is None:
+            return self.search(trace)
+
+        key = self.cache.key(self.fingerprint, tuple(event[log_lib.util.xes.DEFAULT_NAME_KEY] for event in trace))
+        alignment = self.cache.get(key)
+        if alignment is None:
+            alignment = self.search(trace)
+            self.__cache_put(key, alignment)
+        return alignment
+
+    def search(self, trace):
+        # (uncached) replayed or exact alignment within budget, otherwise approximate alignment, otherwise fallback alignment
+        if self.replay:
+            steps = replay_trace(trace, self.replay_net)
+            if steps is not None:
+                return self.__fitting_alignment(trace, steps)
+
+        if self.max_length is None or len(trace) <= self.max_length:
+            alignment = align_trace(trace, self.net, self.im, self.fm, self.model_cost_function, self.sync_cost_function, self.filter_invis, self.max_time)
+            if alignment is not None:
+                alignment.update(exact=True, path='astar')
+                return alignment
+
+        alignment = approx_align_trace(trace, self.net, self.im, self.fm, self.model_cost_function, self.sync_cost_function, self.filter_invis,
+                                       self.max_time, self.max_expansions)
+        if alignment is not None:
+            alignment.update(exact=False, path='approx')
+            return alignment
+
+        return self.__fallback_alignment(trace)
+
+    def __fitting_alignment(self, trace, steps):
+        # result of a replayed trace, in the format of align_trace (cost 0, fitness 1)
+        if self.filter_invis:
+            steps = filter_invis_steps(steps)
+
+        return { 'alignment': steps, 'cost': 0, 'visited_states': 0, 'queued_states': 0, 'traversed_arcs': 0, 'lp_solved': 0,
+                 'fitness': 1.0, 'bwc': MOVE_COST * len(trace) + self.best_worst_cost, 'exact': True, 'path': 'replay' }
+
+    def __fallback_alignment(self, trace):
+        # all log moves, followed by a cheapest path through the model (cost = bwc, fitness 0)
+        steps = [ (event[log_lib.util.xes.DEFAULT_NAME_KEY], '>>') for event in trace ] + self.model_path
+        if self.filter_invis:
+            steps = filter_invis_steps(steps)
+        cost = MOVE_COST * len(trace) + self.best_worst_cost
+
+        return { 'alignment': steps, 'cost': cost, 'visited_states': 0, 'queued_states': 0, 'traversed_arcs': 0, 'lp_solved': 0,
+                 'fitness': 0.0, 'bwc': cost, 'exact': False, 'path': 'fallback' }
+
+    def align_many(self, traces, return_variants=False, n_jobs=None):
+        # alignments are computed once per variant (unique activity sequence) and fanned out to all its traces (in order of traces)
+        # return_variants: also return { sequence: { 'alignment': <alignment>, 'count': <nr. of traces> } }
+        # n_jobs: align variants across this many processes (-1: all CPUs; see align_parallel)
+        sequences, variants = group_variants(traces)
+        keys = {}
+        if self.cache is not None:
+            for sequence, variant in variants.items():
+                keys[sequence] = self.cache.key(self.fingerprint, sequence)
+                alignment = self.cache.get(keys[sequence])
+                if alignment is not None:
+                    variant['alignment'] = alignment
+
+        todo = [ sequence for sequence, variant in variants.items() if 'alignment' not in variant ]
+        if n_jobs is not None and n_jobs != 1:
+            from .align_parallel import align_sequences_parallel
+
+            aligned = align_sequences_parallel(self, todo, n_jobs)
+        else:
+            aligned = [ self.search(variants[sequence]['trace']) for sequence in todo ]
+        for sequence, alignment in zip(todo, aligned):
+            variants[sequence]['alignment'] = alignment
+            if self.cache is not None:
+                self.__cache_put(keys[sequence], alignment)
+        for variant in variants.values():
+            del variant['trace']
+
+        # (shallow copy per trace, so traces don't share the same result dict)
+        alignments = [ dict(variants[sequence]['alignment']) if variants[sequence]['alignment'] is not None else None for sequence in sequences ]
+        if return_variants:
+            return alignments, variants
+        return alignments
+
+    def iter_align(self, traces, progress=None, progress_every=1.0):
+        """
+        Generator of (case id, alignment), in order of traces, yielding each alignment as soon as it is computed
+        (traces may be a generator as well). Alignments are kept per variant only, not per trace,
+        so memory stays bounded by the nr. of variants; see write_alignments to store results in a file.
+
+        Parameters
+        -----------------
+        progress
+            (optional) callback, called with a dict of done, total (None if traces has no length), elapsed (s),
+            rate (traces/s) and eta (s); e.g., print_progress
+        progress_every
+            minimal nr. of seconds between progress callbacks (the last trace is always reported)
+        """
+
+        total = len(traces) if hasattr(traces, '__len__') else None
+        aligned = {}
+        start = last = time.time()
+        done = reported = 0
+        for done, trace in enumerate(traces, 1):
+            sequence = tuple(event[log_lib.util.xes.DEFAULT_NAME_KEY] for event in trace)
+            if sequence not in aligned:
+                aligned[sequence] = self.align(trace)
+            alignment = aligned[sequence]
+            yield trace.attributes.get(log_lib.util.xes.DEFAULT_TRACEID_KEY, done - 1), dict(alignment) if alignment is not None else None
+
+            now = time.time()
+            if progress is not None and (now - last >= progress_every or done == total):
+                last, reported = now, done
+                progress(progress_info(done, total, now - start))
+
+        # (total unknown up front)
+        if progress is not None and reported != done:
+            progress(progress_info(done, done, time.time() - start))
+
+    def __cache_put(self, key, alignment):
+        # (approximate alignments are not cached; a later run with a larger budget may find the exact one)
+        if alignment is not None and alignment['exact']:
+            self.cache.put(key, alignment)
+
+    def __getstate__(self):
+        # (sent to worker processes without the cache; see align_parallel)
+        state = self.__dict__.copy()
+        state['cache'] = None
+        return state
+
+
+def group_variants(traces):
+    # per trace, its activity sequence + per unique sequence, a representative trace and its nr. of traces
+    sequences = []
+    variants = {}
+    for trace in traces:
+        sequence = tuple(event[log_lib.util.xes.DEFAULT_NAME_KEY] for event in trace)
+        sequences.append(sequence)
+        if sequence in variants:
+            variants[sequence]['count'] += 1
+        else:
+            variants[sequence] = { 'trace': trace, 'count': 1 }
+
+    return sequences, variants
+
+# see AlignmentModel.align_many; budgets: see AlignmentModel (max_time, max_length, max_expansions)
+def align_bpmn_log(bpmn, log, filter_invis=False, return_variants=False, n_jobs=None, cache=None, **budgets):
+    return AlignmentModel(bpmn, filter_invis, cache, **budgets).align_many(log, return_variants, n_jobs)
+
+# see AlignmentModel.iter_align; e.g., write_alignments(iter_align_bpmn_log(bpmn, log, progress=print_progress), path)
+def iter_align_bpmn_log(bpmn, log, filter_invis=False, cache=None, progress=None, **budgets):
+    return AlignmentModel(bpmn, filter_invis, cache, **budgets).iter_align(log, progress)
+
+def progress_info(done, total, elapsed):
+    rate = done / elapsed if elapsed > 0 else float('nan')
+    eta = (total - done) / rate if total is not None and rate > 0 else None
+    return { 'done': done, 'total': total, 'elapsed': elapsed, 'rate': rate, 'eta': eta }
+
+def print_progress(info):
+    total = f"/{info['total']}" if info['total'] is not None else ""
+    eta = f", ETA {info['eta']:.0f}s" if info['eta'] is not None else ""
+    print(f"\raligned {info['done']}{total} traces ({info['rate']:.1f} traces/s{eta})", end="", flush=True)
+
+def write_alignments(alignments, path, chunksize=100000):
+    """
+    Write (case id, alignment) pairs (e.g., from AlignmentModel.iter_align) to a Parquet file, in chunks,
+    so alignments don't need to be kept in memory. One row per alignment step, with columns
+    case, step, trace (trace label; '>>' if model move), model (model label; '>>' if log move, null if invisible),
+    cost, fitness, exact and path (per alignment; repeated on its steps). Labels are dictionary-encoded.
+
+    Returns
+    -----------------
+    nr. of alignments written
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([ ('case', pa.string()), ('step', pa.int32()), ('trace', pa.string()), ('model', pa.string()),
+                         ('cost', pa.float64()), ('fitness', pa.float64()), ('exact', pa.bool_()), ('path', pa.string()) ])
+    columns = { name: [] for name in schema.names }
+    num_alignments = 0
+
+    def flush():
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        for column in columns.values():
+            column.clear()
+
+    with pq.ParquetWriter(path, schema, use_dictionary=[ 'case', 'trace', 'model', 'path' ]) as writer:
+        for case, alignment in alignments:
+            num_alignments += 1
+            # (no steps: alignment not found within budget)
+            steps = alignment['alignment'] if alignment is not None else []
+            for step, (trace_label, model_label) in enumerate(steps):
+                columns['case'].append(str(case))
+                columns['step'].append(step)
+                columns['trace'].append(trace_label)
+                columns['model'].append(model_label)
+                columns['cost'].append(alignment['cost'])
+                columns['fitness'].append(alignment.get('fitness'))
+                columns['exact'].append(alignment.get('exact'))
+                columns['path'].append(alignment.get('path'))
+            if len(columns['case']) >= chunksize:
+                flush()
+        flush()
+
+    return num_alignments
+
+# (to align multiple traces one by one, use an AlignmentModel)
+def align_bpmn_trace(bpmn, trace, filter_invis=False, cache=None, **budgets):
+    return AlignmentModel(bpmn, filter_invis, cache, **budgets).align(trace)
 
 
 # copied from
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pm4py.objects.log.obj import Trace, Event
+from pm4py.objects import log as log_lib
+
+# per worker process: AlignmentModel, set by init_worker
+__worker_model = None
+
+def align_sequences_parallel(model, sequences, n_jobs=-1):
+    """
+    Align activity sequences (e.g., the variants of a log) across a process pool.
+    The AlignmentModel (Petri net, markings, cost functions & budgets) is sent to each worker once
+    (pool initializer), so per task only the activity sequence is pickled. Longest sequences are
+    scheduled first, so a long (expensive) sequence doesn't end up running alone at the end.
+
+    Parameters
+    -----------------
+    model
+        align_log.AlignmentModel (its cache is not used by the workers)
+    sequences
+        list of activity sequences (tuples of activity labels)
+    n_jobs
+        number of worker processes (-1: all CPUs)
+
+    Returns
+    -----------------
+    list of alignments (see AlignmentModel.search), in the order of sequences
+    """
+
+    n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+    # longest first
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]), reverse=True)
+
+    alignments = [ None ] * len(sequences)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, max(len(sequences), 1)), initializer=init_worker, initargs=(model,)) as pool:
+        futures = { i: pool.submit(align_task, sequences[i]) for i in order }
+        for i, future in futures.items():
+            alignments[i] = future.result()
+
+    return alignments
+
+def init_worker(model):
+    global __worker_model
+    __worker_model = model
+
+def align_task(sequence):
+    return __worker_model.search(sequence_to_trace(sequence))
+
+def sequence_to_trace(sequence):
+    return Trace([ Event({ log_lib.util.xes.DEFAULT_NAME_KEY: activity }) for activity in sequence ])
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from .align_log import MOVE_COST
+
+MOVE_TYPES = [ 'sync', 'log', 'model', 'invisible' ]
+
+def alignment_table(alignments):
+    """
+    Long-format table of alignment steps, with columns
+    case, step, trace (trace label; '>>' if model move), model (model label; '>>' if log move, NaN if invisible),
+    move (one of MOVE_TYPES) and cost (see align_log.MOVE_COST).
+    Labels, cases and moves are categoricals, so summaries over millions of steps are groupbys on integer codes.
+
+    Parameters
+    -----------------
+    alignments
+        list of alignments (e.g., from align_bpmn_log; case = position in list),
+        iterable of (case id, alignment) pairs (e.g., from AlignmentModel.iter_align),
+        or path of a Parquet file written by align_log.write_alignments
+    """
+
+    if isinstance(alignments, str):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(alignments, columns=[ 'case', 'step', 'trace', 'model' ], read_dictionary=[ 'case', 'trace', 'model' ]).to_pandas()
+        return __add_moves(table)
+
+    cases = []
+    lengths = []
+    trace = []
+    model = []
+    for i, item in enumerate(alignments):
+        case, alignment = item if isinstance(item, tuple) else (i, item)
+        # (no steps: alignment not found within budget)
+        steps = alignment['alignment'] if alignment is not None else []
+        cases.append(str(case))
+        lengths.append(len(steps))
+        trace.extend(step[0] for step in steps)
+        model.extend(step[1] for step in steps)
+
+    lengths = np.array(lengths, dtype=np.int64)
+    # (step nr. within its case)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    table = pd.DataFrame({
+        'case': pd.Categorical(np.repeat(np.array(cases, dtype=object), lengths), categories=pd.unique(np.array(cases, dtype=object))),
+        'step': (np.arange(lengths.sum()) - starts).astype(np.int32),
+        'trace': pd.Categorical(trace),
+        'model': pd.Categorical(model)
+    })
+
+    return __add_moves(table)
+
+def __add_moves(table):
+    model_move = (table['trace'] == '>>').to_numpy()
+    invisible = model_move & table['model'].isna().to_numpy()
+    log_move = (table['model'] == '>>').to_numpy()
+
+    codes = np.select([ log_move, model_move & ~invisible, invisible ], [ 1, 2, 3 ], default=0).astype(np.int8)
+    table['move'] = pd.Categorical.from_codes(codes, categories=MOVE_TYPES)
+    table['cost'] = np.where(log_move | (model_move & ~invisible), MOVE_COST, 0).astype(np.int32)
+
+    return table
+
+def activity_deviations(table):
+    # per activity, nr. of log moves (in trace, not in model) and model moves (in model, missing in trace)
+    deviating = table.loc[table['move'].isin([ 'log', 'model' ])]
+    is_log = (deviating['move'] == 'log').to_numpy()
+    activity = np.where(is_log, deviating['trace'].astype(object), deviating['model'].astype(object))
+
+    counts = pd.crosstab(pd.Series(activity, name='activity'), pd.Series(np.where(is_log, 'log_moves', 'model_moves'), name='move'))
+    counts = counts.reindex(columns=[ 'log_moves', 'model_moves' ], fill_value=0).rename_axis(columns=None)
+    return counts.loc[counts.sum(axis=1).sort_values(ascending=False, kind='stable').index]
+
+def case_fitness(table):
+    # per case, cost, nr. of moves per type and move-based fitness:
+    # 1 - (log moves + model moves) / (trace events + model moves)
+    moves = pd.crosstab(table['case'], table['move'], dropna=False).reindex(columns=MOVE_TYPES, fill_value=0)
+    moves.columns = [ f'{move}_moves' for move in MOVE_TYPES ]
+    stats = moves.assign(cost=table.groupby('case', observed=False)['cost'].sum())
+
+    deviations = stats['log_moves'] + stats['model_moves']
+    total = stats['sync_moves'] + stats['log_moves'] + stats['model_moves']
+    stats['fitness'] = np.where(total > 0, 1 - deviations / total.where(total > 0, 1), 1.0)
+    return stats
+
+def variant_cost(table):
+    # per variant (sequence of trace labels), nr. of cases and mean/total alignment cost; most frequent first
+    events = table.loc[table['move'].isin([ 'sync', 'log' ])]
+    sequences = events.groupby('case', observed=False)['trace'].agg(tuple)
+    costs = table.groupby('case', observed=False)['cost'].sum()
+
+    per_case = pd.DataFrame({ 'variant': sequences.reindex(costs.index, fill_value=()), 'cost': costs })
+    stats = per_case.groupby('variant', sort=False)['cost'].agg([ 'count', 'mean', 'sum' ])
+    stats.columns = [ 'cases', 'mean_cost', 'total_cost' ]
+    return stats.sort_values(by='cases', ascending=False, kind='stable')
@@ -0,0 +1,94 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+
+from .event_log import CASE_KEY
+
+# (path, mtime of index) -> loaded index
+__loaded = {}
+
+def index_path(path):
+    return path + ".cases.parquet"
+
+def has_case_index(path):
+    # index exists and is not older than the log
+    idx_path = index_path(path)
+    return os.path.exists(idx_path) and os.path.getmtime(idx_path) >= os.path.getmtime(path)
+
+def build_case_index(path, chunksize=1000000):
+    """
+    Build a sidecar index (<path>.cases.parquet) of a case-sorted CSV log,
+    mapping each case id to the byte range (and rows) of its events.
+    Assumes records don't contain embedded newlines.
+
+    Returns
+    -----------------
+    index dataframe with columns case, start, end (byte offsets), row, rows
+    """
+
+    # row -> case
+    cases = pd.concat([ chunk[CASE_KEY] for chunk in pd.read_csv(path, usecols=[ CASE_KEY ], dtype={ CASE_KEY: str }, chunksize=chunksize) ],
+                      ignore_index=True).to_numpy(dtype=object)
+
+    # line -> byte offset where it starts (line 0 = header)
+    line_starts = [ np.array([ 0 ], dtype=np.int64) ]
+    offset = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 24), b''):
+            line_starts.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + offset + 1)
+            offset += len(block)
+    line_starts = np.concatenate(line_starts)
+    # (last line may or may not end with a newline; blank trailing lines are not rows)
+    line_starts = line_starts[line_starts < offset]
+
+    if len(line_starts) != len(cases) + 1:
+        raise ValueError(f"{path}: nr. of lines does not match nr. of rows (embedded newlines or blank lines?); cannot index")
+
+    # runs of the same case
+    run_starts = np.flatnonzero(np.r_[True, cases[1:] != cases[:-1]])
+    run_cases = cases[run_starts]
+    if len(pd.unique(run_cases)) != len(run_cases):
+        raise ValueError(f"{path}: log is not sorted on case; cannot index")
+
+    row_ends = np.r_[run_starts[1:], len(cases)]
+    # (row i = line i + 1)
+    byte_ends = np.r_[line_starts[2:], offset]
+    index = pd.DataFrame({
+        'case': run_cases.astype(str),
+        'start': line_starts[run_starts + 1],
+        'end': byte_ends[row_ends - 1],
+        'row': run_starts,
+        'rows': row_ends - run_starts
+    })
+    index.to_parquet(index_path(path), index=False)
+
+    return index
+
+def load_case_index(path):
+    idx_path = index_path(path)
+    key = (idx_path, os.path.getmtime(idx_path))
+    if key not in __loaded:
+        __loaded[key] = pd.read_parquet(idx_path).set_index('case')
+
+    return __loaded[key]
+
+def read_cases(path, cases):
+    """
+    Read the events of given cases from an indexed, case-sorted CSV log (see build_case_index)
+    by seeking directly to their byte ranges; cases not in the log are ignored.
+    Columns are returned as parsed by pd.read_csv (as with the full log).
+    """
+
+    index = load_case_index(path)
+    ranges = index.reindex(pd.unique(np.asarray([ str(case) for case in cases ], dtype=object))).dropna()
+    ranges = ranges.sort_values(by='start')
+
+    with open(path, 'rb') as file:
+        data = [ file.readline() ]
+        for start, end in zip(ranges['start'].astype(np.int64), ranges['end'].astype(np.int64)):
+            file.seek(start)
+            chunk = file.read(end - start)
+            data.append(chunk if chunk.endswith(b'\n') else chunk + b'\n')
+
+    return pd.read_csv(io.BytesIO(b''.join(data)))
@@ -1,31 +1,41 @@
-from functools import reduce
 from enum import Enum
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from pm4py.algo.discovery.dfg.adapters.pandas import df_statistics
-from pm4py.objects.log.util import dataframe_utils
-
-def mine_dfg_metrics(log):
-    log = dataframe_utils.convert_timestamp_columns_in_df(log, timest_columns=['time:timestamp'])
-    dfg_frequency, dfg_performance = df_statistics.get_dfg_graph(log, measure="both",
-                                                                    activity_key='concept:name',
-                                                                    timestamp_key='time:timestamp',
-                                                                    case_id_glue='case:concept:name',
-                                                                    start_timestamp_key=None,
-                                                                    # perf_aggregation_key="mean")
-                                                                    perf_aggregation_key="all")
-    # print(dfg_frequency)
-    # print(dfg_performance)
-
-    df_freq = pd.DataFrame([ [ key[0], key[1], value ] for key, value in dfg_frequency.items() ], columns=[ 'src', 'tgt', 'freq' ])
-    df_perf = pd.DataFrame([ [ key[0], key[1], value['mean'], value['median'], value['min'], value['max'], value['stdev'] ] for key, value in dfg_performance.items() ], 
-                        columns=[ 'src', 'tgt', 'time_mean', 'time_median', 'time_min', 'time_max', 'time_stdev' ])
-    # df_perf = pd.DataFrame([ [ key[0], key[1], value ] for key, value in dfg_performance.items() ], 
-    #                     columns=[ 'src', 'tgt', 'time_mean' ])
-
-    # combine both metrics for each edge
-    return df_freq.merge(df_perf, how='inner', on=['src', 'tgt'], validate=None)
+from .event_log import as_event_log, read_event_log
+from .dfg_stats import edge_metrics, edge_stats, edge_sketch, stats_to_metrics, PERF_AGGREGATIONS
+from .dfg_stream import stream_dfg_metrics, DFGState
+from .dfg_parallel import mine_dfgs_parallel
+from .abstract_events import abstract_log
+
+# log: dataframe, EventLog, DFGState or path of CSV log
+# chunksize: (path only) stream the log in chunks of given size (see dfg_stream.stream_dfg_metrics)
+# rules: abstraction rules applied before mining (see abstract_events.abstract_log)
+# perf_aggregation: 'exact' (sorts all durations per edge) or 'sketch' (constant memory per edge;
+# running mean/variance, min/max and a quantile sketch for the median; always used when streaming)
+def mine_dfg_metrics(log, chunksize=None, sorted_by='case', max_open_cases=None, rules=None, perf_aggregation='exact'):
+    if perf_aggregation not in PERF_AGGREGATIONS:
+        raise ValueError(f"perf_aggregation should be one of {PERF_AGGREGATIONS}, got '{perf_aggregation}'")
+    if isinstance(log, DFGState):
+        return log.metrics()
+    if isinstance(log, str):
+        if chunksize is not None:
+            if rules is not None and len(rules) > 0:
+                raise ValueError("abstraction rules are not supported when streaming a log")
+            return stream_dfg_metrics(log, chunksize, sorted_by, max_open_cases)
+        log = read_event_log(log)
+
+    # per edge: freq, time_mean, time_median, time_min, time_max, time_stdev (seconds)
+    # (sorts once on case & timestamp, shifts code & timestamp arrays, one grouped reduction)
+    log = as_event_log(log)
+    if rules is not None and len(rules) > 0:
+        log = abstract_log(log.copy(), rules)
+    src, tgt, dur = log.directly_follows()
+    dur = dur / 1e9
+
+    if perf_aggregation == 'sketch':
+        return stats_to_metrics(edge_stats(src, tgt, dur), log.activities, edge_sketch(src, tgt, dur))
+    return edge_metrics(src, tgt, dur, log.activities)
 
 
 class GroupTypes(Enum):
@@ -45,11 +55,34 @@ def dict_to_dfg(dict, index):
     
     return dfg
 
-def logs_to_dfgs(logs):
-    return [ log_to_dfg(log, index) for index, log in enumerate(logs) ]
+# n_jobs: if given, mine the logs in parallel across n_jobs processes (-1: all CPUs)
+# cache: DFGCache; DFGs of logs given as paths are reused if mined earlier with the same parameters
+def logs_to_dfgs(logs, n_jobs=None, cache=None, **mine_args):
+    if cache is None:
+        dfgs = __mine_dfgs(logs, n_jobs, mine_args)
+    else:
+        keys = [ cache.key(log, kind='dfg_metrics', **mine_args) if isinstance(log, str) else None for log in logs ]
+        dfgs = [ cache.get(key) if key is not None else None for key in keys ]
+
+        # only mine the cache misses
+        misses = [ index for index, dfg in enumerate(dfgs) if dfg is None ]
+        for index, dfg in zip(misses, __mine_dfgs([ logs[index] for index in misses ], n_jobs, mine_args)):
+            if keys[index] is not None:
+                cache.put(keys[index], dfg)
+            dfgs[index] = dfg
+
+    return [ __index_dfg(dfg, index) for index, dfg in enumerate(dfgs) ]
+
+def __mine_dfgs(logs, n_jobs, mine_args):
+    if n_jobs is not None and n_jobs != 1 and len(logs) > 1:
+        return mine_dfgs_parallel(logs, n_jobs, **mine_args)
+    return [ mine_dfg_metrics(log, **mine_args) for log in logs ]
 
-def log_to_dfg(log, index):
-    dfg = mine_dfg_metrics(log)
+# mine_args: passed to mine_dfg_metrics (e.g., chunksize for streaming)
+def log_to_dfg(log, index, **mine_args):
+    return __index_dfg(mine_dfg_metrics(log, **mine_args), index)
+
+def __index_dfg(dfg, index):
     dfg.columns = [ f"{col}_{index}" if (col != 'src' and col != 'tgt') else col for col in dfg.columns ]
     return dfg
 
@@ -57,45 +90,106 @@ def merge_dfgs(dfgs):
     # outer join over all DFG dataframes on edges
     # if DFG has edge, will have value copied for metric columns
     # if DFG does not have edge, will have NaN for metric columns
-    # ('suffixes' somehow not working propertly for multiple merges)
-    return reduce(lambda dfg_x, dfg_y: dfg_x.merge(dfg_y, on=[ 'src', 'tgt' ], how='outer', suffixes=("", "")), dfgs)
-
-def compare_dfgs(dfgs):
-    merge = merge_dfgs(dfgs)
-    # print(merge)
-
-    node_diff = []
-    edge_diff = []
-    
-    # compare each DFG to every other DFG
-    for i in range(len(dfgs)):
-        dfg_i = dfgs[i]
-
-        # get unique nodes in DFG i
-        unique_i = set([*dfg_i['src'], *dfg_i['tgt']])
-        
-        for j in range(len(dfgs)):
-            if i == j:
-                continue
-
-            dfg_j = dfgs[j]
-            # get unique nodes in DFG j
-            unique_j = set([*dfg_j['src'], *dfg_j['tgt']])
-
-            # compare two node sets
-            only_in_i = (unique_i - unique_j)
-            node_diff.extend([ [ i, j, node ] for node in only_in_i ])
-
-            # get edges found in DFG i but not in DFG j
-            only_in_i = merge.loc[pd.isnull(merge[f'freq_{j}'])&pd.notnull(merge[f'freq_{i}']), [ 'src', 'tgt' ]].to_numpy()
-            edge_diff.extend([ [ i, j, edge[0], edge[1] ] for edge in only_in_i ])
+    # (single pass: one shared edge index over all DFGs, into which each DFG's columns are scattered;
+    # linear in the total nr. of edges instead of a pairwise merge per DFG)
+    edges, edge_ids = __edge_index(dfgs)
+
+    columns = {}
+    for dfg, ids in zip(dfgs, edge_ids):
+        for col in dfg.columns:
+            if col != 'src' and col != 'tgt':
+                # (keeps dtype if DFG has all edges, like merge)
+                columns[col] = pd.Series(dfg[col].to_numpy(), index=ids).reindex(range(len(edges))).to_numpy()
+
+    return pd.concat([ edges, pd.DataFrame(columns, index=edges.index) ], axis=1)
+
+def __edge_index(dfgs):
+    # shared (sorted) edge index over all DFGs + per DFG, the positions of its edges in that index
+    all_edges = pd.concat([ dfg[[ 'src', 'tgt' ]] for dfg in dfgs ], ignore_index=True)
+    all_ids = all_edges.groupby([ 'src', 'tgt' ], sort=True).ngroup().to_numpy()
+
+    first = np.zeros(all_ids.max() + 1 if len(all_ids) > 0 else 0, dtype=np.int64)
+    first[all_ids[::-1]] = np.arange(len(all_ids))[::-1]
+    edges = all_edges.iloc[first].reset_index(drop=True)
+
+    bounds = np.cumsum([ 0, *[ len(dfg) for dfg in dfgs ] ])
+    return edges, [ all_ids[start:end] for start, end in zip(bounds[:-1], bounds[1:]) ]
+
+# compact: instead of expanding every pair (i, j) into rows, return per node / edge
+# a presence bitmask over the logs (bit i set = found in DFG i), only for nodes / edges not found in all DFGs
+def compare_dfgs(dfgs, compact=False):
+    num_dfgs = len(dfgs)
+
+    # nodes: shared node index + presence per DFG
+    dfg_nodes = [ pd.unique(pd.concat([ dfg['src'], dfg['tgt'] ]).to_numpy(dtype=object)) for dfg in dfgs ]
+    node_ids, nodes = pd.factorize(np.concatenate(dfg_nodes) if num_dfgs > 0 else np.array([], dtype=object), sort=True)
+    node_presence = __presence(np.split(node_ids, np.cumsum([ len(n) for n in dfg_nodes ])[:-1]), len(nodes))
+
+    # edges: shared edge index (cfr. merge_dfgs) + presence per DFG
+    edges, edge_ids = __edge_index(dfgs)
+    edge_presence = __presence(edge_ids, len(edges))
+
+    node_presence = pd.DataFrame({ 'node': np.asarray(nodes, dtype=object), 'logs': __to_bitmask(node_presence) })
+    edge_presence = pd.concat([ edges, pd.DataFrame({ 'logs': __to_bitmask(edge_presence) }) ], axis=1)
+
+    # only nodes / edges missing from some DFG can differ
+    full = __full_bitmask(num_dfgs)
+    node_presence = node_presence.loc[node_presence['logs'] != full].reset_index(drop=True)
+    edge_presence = edge_presence.loc[edge_presence['logs'] != full].reset_index(drop=True)
+    if compact:
+        return [ node_presence, edge_presence ]
 
     # for DFG i, keeps unique/missing nodes/edges per DFG j
-    node_diff = pd.DataFrame(node_diff, columns=[ 'dfg_i', 'dfg_j', 'node' ])
-    edge_diff = pd.DataFrame(edge_diff, columns=[ 'dfg_i', 'dfg_j', 'src', 'tgt' ])
+    node_diff = presence_to_diff(node_presence, num_dfgs)
+    edge_diff = presence_to_diff(edge_presence, num_dfgs)
 
     return [ node_diff, edge_diff ]
 
+def presence_to_diff(presence, num_dfgs):
+    # expand presence bitmasks into rows (dfg_i, dfg_j, <element>): found in DFG i but not in DFG j
+    # (vectorized over elements; for each i, all j at once)
+    bits = __from_bitmask(presence['logs'].to_numpy(), num_dfgs) # (num_dfgs, num_elements)
+    elem_cols = [ col for col in presence.columns if col != 'logs' ]
+
+    rows_i, rows_j, rows_elem = [], [], []
+    for i in range(num_dfgs):
+        only_in_i = bits[i][None,:] & ~bits
+        j, elem = np.nonzero(only_in_i)
+        rows_i.append(np.full(len(j), i))
+        rows_j.append(j)
+        rows_elem.append(elem)
+
+    elem = np.concatenate(rows_elem) if num_dfgs > 0 else np.array([], dtype=np.int64)
+    diff = pd.DataFrame({ 'dfg_i': np.concatenate(rows_i) if num_dfgs > 0 else elem, 'dfg_j': np.concatenate(rows_j) if num_dfgs > 0 else elem })
+    for col in elem_cols:
+        diff[col] = presence[col].to_numpy()[elem]
+
+    return diff
+
+def __presence(ids_per_dfg, num_elements):
+    # (num_elements, num_dfgs) boolean presence matrix
+    presence = np.zeros((num_elements, len(ids_per_dfg)), dtype=bool)
+    for index, ids in enumerate(ids_per_dfg):
+        presence[ids, index] = True
+    return presence
+
+def __bit_values(num_dfgs):
+    # up to 64 DFGs fit in uint64 masks; beyond that, Python ints (object arrays) are used
+    if num_dfgs <= 64:
+        return np.left_shift(np.uint64(1), np.arange(num_dfgs, dtype=np.uint64))
+    return np.array([ 1 << i for i in range(num_dfgs) ], dtype=object)
+
+def __full_bitmask(num_dfgs):
+    return __bit_values(num_dfgs).sum() if num_dfgs > 0 else 0
+
+def __to_bitmask(presence):
+    bit_values = __bit_values(presence.shape[1])
+    return (presence.astype(bit_values.dtype) * bit_values).sum(axis=1)
+
+def __from_bitmask(masks, num_dfgs):
+    bit_values = __bit_values(num_dfgs)
+    return (masks[None,:] & bit_values[:,None]) != 0
+
 def print_cmp_results(cmp_results, log_labels, group_type=GroupTypes.BY_ELEMENT):
     node_diff, edge_diff = cmp_results
 
@@ -161,16 +255,20 @@ def human_readable_unit(time):
         ret['divis'] = ret['divis'] * divis
 
 # TODO generalize this code
-def plot_metrics_dfg(logs, log_labels=None, metric1=None, metric2=None, normalize=None, time_unit=None, per_edge=False, edges=None):
+def plot_metrics_dfg(logs, log_labels=None, metric1=None, metric2=None, normalize=None, time_unit=None, per_edge=False, edges=None, n_jobs=None, cache=None):
     _, axes = plt.subplots(nrows=1, ncols=2, figsize=(12, 5))
-    plot_metric_dfg(logs, log_labels, metric1, normalize, time_unit, per_edge, edges, subplot_of=axes[0])
-    plot_metric_dfg(logs, log_labels, metric2, normalize, time_unit, per_edge, edges, subplot_of=axes[1])
+    # mine once for both metrics
+    merge = merge_dfgs(logs_to_dfgs(logs, n_jobs=n_jobs, cache=cache))
+    plot_metric_dfg(logs, log_labels, metric1, normalize, time_unit, per_edge, edges, subplot_of=axes[0], merge=merge)
+    plot_metric_dfg(logs, log_labels, metric2, normalize, time_unit, per_edge, edges, subplot_of=axes[1], merge=merge)
 
 # normalize: True/False
 # metric: 'freq', 'time_mean', 'time_median', 'time_min', 'time_max', 'time_stdev'
 # time_unit: min, hr, day, month, year
-def plot_metric_dfg(logs, log_labels, metric='freq', normalize=None, time_unit=None, per_edge=False, edges=None, subplot_of=None):
-    merge = merge_dfgs(logs_to_dfgs(logs))
+# merge: (optional) already merged DFGs of logs
+def plot_metric_dfg(logs, log_labels, metric='freq', normalize=None, time_unit=None, per_edge=False, edges=None, subplot_of=None, merge=None, n_jobs=None, cache=None):
+    if merge is None:
+        merge = merge_dfgs(logs_to_dfgs(logs, n_jobs=n_jobs, cache=cache))
 
     # filter non-metric columns
     merge = merge[['src', 'tgt', *[ f'{metric}_{i}' for i in range(len(logs)) ]]]
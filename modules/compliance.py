@@ -1,9 +1,9 @@
-from copy import deepcopy
-from modules.gviz_utils import EditableDiGraph
+import threading
+from modules.gviz_utils import EditableDiGraph, HighlightOverlay
 from modules.variant_utils import Variant, get_variants_stats
-from modules.align_log import align_bpmn_trace, pretty_print_alignments
+from modules.align_log import AlignmentModel, pretty_print_alignments
 from ipywidgets import Box, Layout, Select, Output, Label, HTML
-from IPython.display import Image
+from IPython.display import Image, SVG
 
 import pm4py
 from pm4py.visualization.bpmn import visualizer as bpmn_visualizer
@@ -24,7 +24,17 @@ def show_gviz(output, gviz, replace=True):
             output.clear_output()
         output.append_display_data(Image(gviz.render()))
 
-def compliance_bpmn_log(bpmn_path, log_path):
+
+def show_svg(output, svg, replace=True):
+    with output:
+        if replace:
+            output.clear_output()
+        output.append_display_data(SVG(svg))
+
+# cache: (optional) AlignmentCache, reused across sessions for the same normative model
+# precompute: align all variants in a background thread (most frequent first) as soon as the widget opens;
+# the variants already aligned are shown below the list
+def compliance_bpmn_log(bpmn_path, log_path, cache=None, precompute=True):
     log = read_log(log_path)
     var_stats = get_variants_stats(log)
     var_list = [Variant(index, row['cov_amt'], row['cov_perc'], row['cov_perc_cumul'],
@@ -32,14 +42,18 @@ def compliance_bpmn_log(bpmn_path, log_path):
     cur_sel = var_list[0]
 
     bpmn = pm4py.read_bpmn(bpmn_path)
+    model = AlignmentModel(bpmn, filter_invis=True, cache=cache)
     bpmn_gviz = bpmn_visualizer.apply(bpmn)
     bpmn_graph = EditableDiGraph(bpmn_gviz)
+    # (laid out once; highlights are applied to the rendered image)
+    bpmn_overlay = HighlightOverlay(bpmn_graph)
 
     var_label = HTML("<h2>Variant</h2>")
     var_model = Output()
     var_model_box = Box(children=[var_model], layout=Layout(overflow='scroll hidden'))
     var_sel = Select(options=var_list, value=cur_sel, disabled=False) # rows=10, description='variant'
-    var_sel_box = Box(children=[var_sel], layout=Layout(max_width='175px'))
+    var_progress = HTML()
+    var_sel_box = Box(children=[var_sel, var_progress], layout=Layout(display='flex', flex_flow='column', max_width='175px'))
     var_box = Box(children=[var_sel_box, var_model_box], layout=Layout(display='flex', flex_flow='row'))
     align_label = HTML("<h2>Alignment</h2>")
     align_model = Output()
@@ -50,13 +64,57 @@ def compliance_bpmn_log(bpmn_path, log_path):
 
     # box = Box(children=[model_box, var_sel], layout=Layout(display='flex', flex_flow='row'))
 
+    # variant nr -> alignment
+    alignments = {}
+    # (one alignment at a time; a waiting selection goes before the next background variant)
+    align_cond = threading.Condition()
+    aligning = [ False ]
+    selections_waiting = [ 0 ]
+
+    def align_variant(var, background=False):
+        # (finished variants are served right away, without waiting for the background alignment in progress)
+        if var.nr in alignments:
+            return alignments[var.nr]
+
+        with align_cond:
+            if not background:
+                selections_waiting[0] += 1
+            align_cond.wait_for(lambda: not aligning[0] and (not background or selections_waiting[0] == 0))
+            if not background:
+                selections_waiting[0] -= 1
+            if var.nr in alignments:
+                align_cond.notify_all()
+                return alignments[var.nr]
+            aligning[0] = True
+
+        try:
+            alignment = model.align(var.to_trace())
+            alignments[var.nr] = alignment
+        finally:
+            with align_cond:
+                aligning[0] = False
+                align_cond.notify_all()
+        return alignment
+
+    def refresh_progress():
+        # (only the progress text is updated; rebuilding the list's options would reset the selection)
+        done = [ var for var in var_list if var.nr in alignments ]
+        var_progress.value = (f"aligned {len(done)}/{len(var_list)} variants ({sum(var.cov_perc for var in done):.1f}% of cases)"
+                              f"<br>ready: {__nr_ranges(sorted(var.nr for var in done))}")
+
+    def precompute_alignments():
+        # (progress is refreshed after every variant, so it's up to date while the next one is being aligned)
+        for var in var_list:
+            align_variant(var, background=True)
+            refresh_progress()
+
     def on_var_sel(change):
         sel_var = change['new']
 
         show_text(var_model, sel_var.pretty_print())
 
-        alignment = align_bpmn_trace(
-            bpmn, sel_var.to_trace(), filter_invis=True)
+        alignment = align_variant(sel_var)
+        refresh_progress()
         show_text(align_model, pretty_print_alignments(alignment))
 
         miss_activs = []
@@ -64,15 +122,23 @@ def compliance_bpmn_log(bpmn_path, log_path):
             if step[0] == ">>":  # missing in trace
                 miss_activs.append(step[1])
 
-        if len(miss_activs) > 0:
-            new_graph = deepcopy(bpmn_graph)
-            for miss_activ in miss_activs:
-                new_graph.label_node[miss_activ]['color'] = 'lightpink'
-                new_graph.label_node[miss_activ]['style'] = 'filled'
-            show_gviz(proc_model, new_graph.to_gviz())
+        # (no missing activities: plain model)
+        show_svg(proc_model, bpmn_overlay.render(miss_activs))
 
     var_sel.observe(on_var_sel, names='value')
 
     on_var_sel({'new': cur_sel})
+    if precompute:
+        threading.Thread(target=precompute_alignments, daemon=True).start()
 
     return box
+
+def __nr_ranges(nrs):
+    # e.g., [0, 1, 2, 5, 7, 8] -> "0-2, 5, 7-8"
+    ranges = []
+    for nr in nrs:
+        if len(ranges) > 0 and ranges[-1][1] == nr - 1:
+            ranges[-1][1] = nr
+        else:
+            ranges.append([ nr, nr ])
+    return ", ".join(f"{start}-{end}" if end > start else f"{start}" for start, end in ranges)
@@ -0,0 +1,108 @@
+import os
+import glob
+import json
+import hashlib
+import pandas as pd
+
+from .abstract_events import canonical_rules
+
+class DFGCache:
+    """
+    On-disk cache of mined edge tables (DFGs, metrics), stored as Parquet files.
+    Entries are keyed by a hash of the log file's content plus the mining parameters,
+    so a changed log or different parameters never hit a stale entry.
+    Least recently used entries are evicted once the cache exceeds max_bytes.
+
+    Parameters
+    -----------------
+    cache_dir
+        directory holding the cache entries (created if needed)
+    max_bytes
+        maximum total size of the cache entries
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # (path, size, mtime) -> content hash; avoids re-hashing unchanged files within a session
+        self.__content_hashes = {}
+
+    def key(self, path, **params):
+        # <hash of log content>-<hash of parameters>
+        # (rule tables are hashed in canonical form; other parameters should be JSON-serializable)
+        if params.get('rules') is not None:
+            params['rules'] = canonical_rules(params['rules'])
+        try:
+            params = json.dumps(params, sort_keys=True)
+        except TypeError as e:
+            raise TypeError(f"cannot derive a stable cache key from parameters: {e}") from e
+        return f"{self.content_hash(path)}-{hashlib.sha256(params.encode()).hexdigest()[:32]}"
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self.__content_hashes:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    sha.update(block)
+            self.__content_hashes[file_id] = sha.hexdigest()[:32]
+
+        return self.__content_hashes[file_id]
+
+    def get(self, key):
+        entry = self.__entry_path(key)
+        if not os.path.exists(entry):
+            return None
+
+        # (mark as recently used)
+        os.utime(entry)
+        return pd.read_parquet(entry)
+
+    def put(self, key, df):
+        entry = self.__entry_path(key)
+        df.to_parquet(entry + ".tmp", index=False)
+        os.replace(entry + ".tmp", entry)
+        self.__evict()
+
+    def get_or_mine(self, key, mine_fn):
+        df = self.get(key)
+        if df is None:
+            df = mine_fn()
+            self.put(key, df)
+        return df
+
+    def invalidate(self, path=None, key=None):
+        # remove entries of given log file (any parameters) or with given key; if neither given, clear the cache
+        if key is not None:
+            pattern = key
+        elif path is not None:
+            pattern = f"{self.content_hash(path)}-*"
+        else:
+            pattern = "*"
+
+        for entry in glob.glob(os.path.join(self.cache_dir, pattern + ".parquet")):
+            os.remove(entry)
+
+    def clear(self):
+        self.invalidate()
+
+    def size(self):
+        return sum(os.path.getsize(entry) for entry in self.__entries())
+
+    def __entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".parquet")
+
+    def __entries(self):
+        return glob.glob(os.path.join(self.cache_dir, "*.parquet"))
+
+    def __evict(self):
+        entries = [ (os.path.getmtime(entry), os.path.getsize(entry), entry) for entry in self.__entries() ]
+        total = sum(size for _, size, _ in entries)
+        # least recently used first
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(entry)
+            total -= size
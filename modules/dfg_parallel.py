@@ -0,0 +1,88 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .event_log import EventLog, as_event_log
+
+def mine_dfgs_parallel(logs, n_jobs=-1, **mine_args):
+    """
+    Mine DFG metrics of multiple logs across a process pool.
+    Paths are passed as-is (workers read the log themselves); in-memory logs are encoded
+    and their code/timestamp arrays are handed over through shared memory, so the log itself is never pickled.
+
+    Parameters
+    -----------------
+    logs
+        list of dataframes, EventLogs or paths of CSV logs
+    n_jobs
+        number of worker processes (-1: all CPUs)
+    mine_args
+        passed to mine_dfg_metrics
+
+    Returns
+    -----------------
+    list of mine_dfg_metrics dataframes, in the order of logs
+    """
+
+    n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+    shms = []
+    try:
+        tasks = []
+        for log in logs:
+            if isinstance(log, str):
+                tasks.append(log)
+            else:
+                shm, spec = share_event_log(as_event_log(log))
+                shms.append(shm)
+                tasks.append(spec)
+
+        with ProcessPoolExecutor(max_workers=min(n_jobs, max(len(logs), 1))) as pool:
+            futures = [ pool.submit(mine_task, task, mine_args) for task in tasks ]
+            return [ future.result() for future in futures ]
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+def share_event_log(log):
+    # copy case, activity & timestamp arrays into a single shared memory block
+    # (layout: int32 case[n], int32 activity[n], int64 timestamp[n])
+    n = len(log)
+    shm = shared_memory.SharedMemory(create=True, size=max(n * 16, 1))
+    case, activity, timestamp = __shared_arrays(shm, n)
+    case[:] = log.case
+    activity[:] = log.activity
+    timestamp[:] = log.timestamp
+
+    # (vocabulary is small; pickled along with the spec)
+    return shm, { 'shm': shm.name, 'n': n, 'activities': log.activities, 'tz': log.tz }
+
+def attach_event_log(spec):
+    # (workers share the parent's resource tracker; the parent unlinks the block)
+    shm = shared_memory.SharedMemory(name=spec['shm'])
+
+    case, activity, timestamp = __shared_arrays(shm, spec['n'])
+    log = EventLog(case, activity, timestamp, np.array([], dtype=object), spec['activities'], tz=spec['tz'])
+
+    return shm, log
+
+def mine_task(task, mine_args):
+    from .cmp_logs import mine_dfg_metrics
+
+    if isinstance(task, str):
+        return mine_dfg_metrics(task, **mine_args)
+
+    shm, log = attach_event_log(task)
+    try:
+        return mine_dfg_metrics(log, **mine_args)
+    finally:
+        del log
+        shm.close()
+
+def __shared_arrays(shm, n):
+    case = np.ndarray((n,), dtype=np.int32, buffer=shm.buf, offset=0)
+    activity = np.ndarray((n,), dtype=np.int32, buffer=shm.buf, offset=n * 4)
+    timestamp = np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=n * 8)
+
+    return case, activity, timestamp
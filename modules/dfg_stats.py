@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+METRIC_COLS = [ 'freq', 'time_mean', 'time_median', 'time_min', 'time_max', 'time_stdev' ]
+# mergeable per-edge aggregates (count, running mean, sum of squared deviations, min, max)
+STAT_COLS = [ 'count', 'mean', 'm2', 'min', 'max' ]
+PERF_AGGREGATIONS = [ 'exact', 'sketch' ]
+
+# quantile sketch: log-spaced duration buckets with given relative accuracy (cfr. DDSketch);
+# nr. of buckets per edge is bounded by the range of durations, not by the nr. of events
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+# (durations <= 0)
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+def edge_key(src, tgt):
+    # single int64 key per (src, tgt) code pair; independent of vocabulary size
+    return (np.asarray(src, dtype=np.int64) << 32) | np.asarray(tgt, dtype=np.int64)
+
+def key_src(key):
+    return (np.asarray(key) >> 32).astype(np.int64)
+
+def key_tgt(key):
+    return (np.asarray(key) & 0xFFFFFFFF).astype(np.int64)
+
+def __group_edges(src, tgt, dur):
+    # sorting on (key, dur) groups edges with their durations in order
+    key = edge_key(src, tgt)
+    order = np.lexsort((dur, key))
+    key = key[order]
+    dur = np.asarray(dur, dtype=np.float64)[order]
+
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    ends = np.r_[starts[1:], len(key)]
+
+    return key[starts], starts, ends, dur
+
+def __empty_metrics():
+    return pd.DataFrame({ col: pd.Series(dtype=(object if col in ('src', 'tgt') else float)) for col in [ 'src', 'tgt', *METRIC_COLS ] })
+
+def __stdev(m2, count):
+    return np.sqrt(np.divide(m2, count - 1, out=np.full(len(count), np.nan), where=count > 1))
+
+def edge_metrics(src, tgt, dur, activities):
+    """
+    Per-edge frequency and duration statistics in a single grouped reduction.
+
+    Parameters
+    -----------------
+    src, tgt
+        activity code arrays of all directly-follows pairs
+    dur
+        duration array (seconds) of all directly-follows pairs
+    activities
+        activity vocabulary (code -> label)
+
+    Returns
+    -----------------
+    dataframe with columns src, tgt, freq, time_mean, time_median, time_min, time_max, time_stdev
+    (stdev is the sample stdev; NaN for edges occurring once, as in pm4py)
+    """
+
+    if len(src) == 0:
+        return __empty_metrics()
+
+    keys, starts, ends, dur = __group_edges(src, tgt, dur)
+    freq = ends - starts
+
+    mean = np.add.reduceat(dur, starts) / freq
+    dev = dur - np.repeat(mean, freq)
+    m2 = np.add.reduceat(dev * dev, starts)
+    median = (dur[starts + (freq - 1) // 2] + dur[starts + freq // 2]) / 2
+
+    metrics = pd.DataFrame({
+        'src': activities[key_src(keys)],
+        'tgt': activities[key_tgt(keys)],
+        'freq': freq.astype(np.int64),
+        'time_mean': mean,
+        'time_median': median,
+        'time_min': dur[starts],
+        'time_max': dur[ends - 1],
+        'time_stdev': __stdev(m2, freq)
+    })
+
+    return metrics.sort_values(by=[ 'src', 'tgt' ]).reset_index(drop=True)
+
+def edge_stats(src, tgt, dur):
+    # mergeable aggregates per edge key (see STAT_COLS)
+    if len(src) == 0:
+        return pd.DataFrame({ col: pd.Series(dtype=float) for col in STAT_COLS }, index=pd.Index([], dtype=np.int64))
+
+    keys, starts, ends, dur = __group_edges(src, tgt, dur)
+    count = ends - starts
+
+    mean = np.add.reduceat(dur, starts) / count
+    dev = dur - np.repeat(mean, count)
+
+    return pd.DataFrame({
+        'count': count.astype(np.int64),
+        'mean': mean,
+        'm2': np.add.reduceat(dev * dev, starts),
+        'min': dur[starts],
+        'max': dur[ends - 1]
+    }, index=pd.Index(keys, dtype=np.int64))
+
+def merge_edge_stats(stats_a, stats_b):
+    # combine two aggregates (Chan et al. parallel variance); result is exact for count, mean, stdev, min, max
+    if stats_a is None or len(stats_a) == 0:
+        return stats_b
+    if stats_b is None or len(stats_b) == 0:
+        return stats_a
+
+    index = stats_a.index.union(stats_b.index)
+    fill = { 'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf }
+    a = stats_a.reindex(index).fillna(fill)
+    b = stats_b.reindex(index).fillna(fill)
+
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+
+    return pd.DataFrame({
+        'count': count.astype(np.int64),
+        'mean': a['mean'] + delta * (b['count'] / count),
+        'm2': a['m2'] + b['m2'] + delta * delta * (a['count'] * b['count'] / count),
+        'min': np.minimum(a['min'], b['min']),
+        'max': np.maximum(a['max'], b['max'])
+    }, index=index)
+
+def edge_sketch(src, tgt, dur):
+    # quantile sketch per edge: (key, bucket, count) rows, sorted on key & bucket
+    dur = np.asarray(dur, dtype=np.float64)
+    bucket = np.full(len(dur), ZERO_BUCKET, dtype=np.int64)
+    pos = dur > 0
+    bucket[pos] = np.ceil(np.log(dur[pos]) / np.log(SKETCH_GAMMA))
+
+    sketch = pd.DataFrame({ 'key': edge_key(src, tgt), 'bucket': bucket })
+    sketch = sketch.groupby([ 'key', 'bucket' ], sort=True).size().rename('count').reset_index()
+
+    return sketch
+
+def merge_edge_sketches(sketch_a, sketch_b):
+    if sketch_a is None or len(sketch_a) == 0:
+        return sketch_b
+    if sketch_b is None or len(sketch_b) == 0:
+        return sketch_a
+
+    merged = pd.concat([ sketch_a, sketch_b ], ignore_index=True)
+    return merged.groupby([ 'key', 'bucket' ], sort=True)['count'].sum().reset_index()
+
+def edge_quantiles(sketch, q):
+    # estimated q-quantile (0 <= q <= 1) of durations per edge key (relative error <= SKETCH_ACCURACY);
+    # interpolates linearly between the values at ranks floor & ceil of q * (n - 1), as np.quantile
+    key = sketch['key'].to_numpy()
+    count = sketch['count'].to_numpy()
+    bucket = sketch['bucket'].to_numpy()
+
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    total = np.add.reduceat(count, starts)
+    cumul = np.cumsum(count)
+    # (0-based) rank of the quantile within the edge
+    rank = q * (total - 1)
+    frac = rank - np.floor(rank)
+
+    def value_at(edge_rank):
+        # (as position in the global cumulative counts)
+        pos = np.searchsorted(cumul, (cumul[starts] - count[starts]) + edge_rank, side='right')
+        found = bucket[pos]
+        return np.where(found == ZERO_BUCKET, 0.0, 2 * np.power(SKETCH_GAMMA, found.astype(np.float64)) / (SKETCH_GAMMA + 1))
+
+    value = (1 - frac) * value_at(np.floor(rank)) + frac * value_at(np.ceil(rank))
+
+    return pd.Series(value, index=pd.Index(key[starts], dtype=np.int64))
+
+def stats_to_metrics(stats, activities, sketch=None):
+    # mine_dfg_metrics-compatible frame from aggregates
+    # (median is estimated from the quantile sketch, if given; otherwise left NaN)
+    if stats is None or len(stats) == 0:
+        return __empty_metrics()
+
+    count = stats['count'].to_numpy()
+    median = np.nan
+    if sketch is not None:
+        # (estimate can't lie outside the observed range; exact for edges with a single duration)
+        median = np.clip(edge_quantiles(sketch, 0.5).reindex(stats.index).to_numpy(), stats['min'].to_numpy(), stats['max'].to_numpy())
+    metrics = pd.DataFrame({
+        'src': activities[key_src(stats.index)],
+        'tgt': activities[key_tgt(stats.index)],
+        'freq': count.astype(np.int64),
+        'time_mean': stats['mean'].to_numpy(),
+        'time_median': median,
+        'time_min': stats['min'].to_numpy(),
+        'time_max': stats['max'].to_numpy(),
+        'time_stdev': __stdev(stats['m2'].to_numpy(), count)
+    })
+
+    return metrics.sort_values(by=[ 'src', 'tgt' ]).reset_index(drop=True)
+
+def combine_edge_stats(stats):
+    # merge aggregates of rows with the same index (e.g., edges that were remapped onto the same edge)
+    grouped = stats.groupby(level=list(range(stats.index.nlevels)), sort=True)
+    count = grouped['count'].sum()
+    mean = (stats['count'] * stats['mean']).groupby(level=list(range(stats.index.nlevels)), sort=True).sum() / count
+    # M2 = sum of M2's + sum of count * (mean - combined mean)^2
+    dev = stats['count'] * (stats['mean'] - mean.reindex(stats.index).to_numpy()) ** 2
+    m2 = grouped['m2'].sum() + dev.groupby(level=list(range(stats.index.nlevels)), sort=True).sum()
+
+    return pd.DataFrame({ 'count': count.astype(np.int64), 'mean': mean, 'm2': m2, 'min': grouped['min'].min(), 'max': grouped['max'].max() })
+
+def generalize_dfg(metrics, mapping):
+    """
+    DFG metrics of a generalized log (cfr. abstract_events.generalize_events), derived from the base DFG
+    without re-mining: relabeling activities only renames the endpoints of each directly-follows pair,
+    so edges are remapped and combined. Base edges whose endpoints both map onto the same activity become
+    self-loops on that activity, exactly as when re-mining the relabeled log.
+
+    Parameters
+    -----------------
+    metrics
+        mine_dfg_metrics dataframe of the base log
+    mapping
+        dict activity -> generalized activity (unmapped activities are kept)
+
+    Returns
+    -----------------
+    mine_dfg_metrics-compatible dataframe; freq, mean, stdev, min and max are exact.
+    Medians can't be combined: they are kept for edges that map from a single base edge, NaN otherwise
+    (see DFGState.generalize for sketch-based medians).
+    """
+
+    if len(metrics) == 0:
+        return __empty_metrics()
+
+    freq = metrics['freq'].to_numpy()
+    index = pd.MultiIndex.from_arrays([
+        metrics['src'].map(lambda activ: mapping.get(activ, activ)).to_numpy(dtype=object),
+        metrics['tgt'].map(lambda activ: mapping.get(activ, activ)).to_numpy(dtype=object)
+    ], names=[ 'src', 'tgt' ])
+    stats = pd.DataFrame({
+        'count': freq,
+        'mean': metrics['time_mean'].to_numpy(),
+        # (stdev is NaN for single-occurrence edges)
+        'm2': np.nan_to_num(metrics['time_stdev'].to_numpy() ** 2 * (freq - 1)),
+        'min': metrics['time_min'].to_numpy(),
+        'max': metrics['time_max'].to_numpy()
+    }, index=index)
+    combined = combine_edge_stats(stats)
+
+    median = pd.Series(metrics['time_median'].to_numpy(), index=index).groupby(level=[ 0, 1 ], sort=True)
+    single = median.size().to_numpy() == 1
+
+    count = combined['count'].to_numpy()
+    return pd.DataFrame({
+        'src': combined.index.get_level_values(0).to_numpy(dtype=object),
+        'tgt': combined.index.get_level_values(1).to_numpy(dtype=object),
+        'freq': count,
+        'time_mean': combined['mean'].to_numpy(),
+        'time_median': np.where(single, median.first().to_numpy(), np.nan),
+        'time_min': combined['min'].to_numpy(),
+        'time_max': combined['max'].to_numpy(),
+        'time_stdev': __stdev(combined['m2'].to_numpy(), count)
+    })
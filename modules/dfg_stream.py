@@ -0,0 +1,190 @@
+import pickle
+import numpy as np
+import pandas as pd
+
+from .event_log import read_event_log, as_event_log
+from .dfg_stats import edge_stats, merge_edge_stats, combine_edge_stats, edge_sketch, merge_edge_sketches, edge_quantiles, stats_to_metrics, edge_key, key_src, key_tgt
+
+SORTED_BY = [ 'case', 'time' ]
+
+def stream_dfg_metrics(path, chunksize=1000000, sorted_by='case', max_open_cases=None):
+    """
+    Mine DFG metrics from a CSV log in chunks, without loading the entire log.
+    Per edge, counts and timing aggregates are accumulated incrementally;
+    the last event of each open case is carried across chunk boundaries.
+
+    Parameters
+    -----------------
+    path
+        path of CSV log
+    chunksize
+        number of events per chunk
+    sorted_by
+        'case': log is sorted on case (and time within cases); only the last case of a chunk can still be open
+        'time': log is sorted on time; the last event of every open case is kept in a tail buffer
+    max_open_cases
+        (sorted_by='time') bound on the tail buffer; if exceeded, the least recently active cases are considered closed
+
+    Returns
+    -----------------
+    mine_dfg_metrics-compatible dataframe
+    (time_median is estimated from a per-edge quantile sketch; see dfg_stats.edge_sketch)
+    """
+
+    if sorted_by not in SORTED_BY:
+        raise ValueError(f"sorted_by should be one of {SORTED_BY}, got '{sorted_by}'")
+
+    state = DFGState(sorted_by, max_open_cases)
+    for chunk in read_event_log(path, chunksize):
+        state.update(chunk)
+
+    return state.metrics()
+
+
+class DFGState:
+    """
+    Incrementally maintained DFG: per-edge counts & timing aggregates, and the last event of each open case.
+    New events are folded in with update(), so refreshing a growing log only costs the new events.
+    Memory per edge is constant (running mean/variance, min/max and a quantile sketch); states built
+    from disjoint sets of cases (e.g., by different workers) can be combined with merge().
+
+    Parameters
+    -----------------
+    sorted_by
+        'time': updates hold the newest events of (possibly) all open cases (e.g., daily appends)
+        'case': updates are consecutive chunks of a case-sorted log
+    max_open_cases
+        (sorted_by='time') bound on the nr. of open cases kept; least recently active cases are considered closed
+    """
+
+    def __init__(self, sorted_by='time', max_open_cases=None):
+        if sorted_by not in SORTED_BY:
+            raise ValueError(f"sorted_by should be one of {SORTED_BY}, got '{sorted_by}'")
+
+        self.sorted_by = sorted_by
+        self.max_open_cases = max_open_cases
+        self.activities = ActivityVocab()
+        self.tails = empty_tails()
+        self.stats = None
+        self.sketch = None
+
+    def update(self, events):
+        # events: dataframe or EventLog with new events
+        (src, tgt, dur), self.tails = consume_chunk(as_event_log(events), self.tails, self.activities, self.sorted_by, self.max_open_cases)
+        self.stats = merge_edge_stats(self.stats, edge_stats(src, tgt, dur))
+        self.sketch = merge_edge_sketches(self.sketch, edge_sketch(src, tgt, dur))
+        return self
+
+    def merge(self, other):
+        # fold in the state of another (disjoint) set of cases; edge keys are mapped onto this state's vocabulary
+        code_map = self.activities.codes(other.activities.labels()).astype(np.int64)
+        remap = lambda keys: edge_key(code_map[key_src(keys)], code_map[key_tgt(keys)])
+
+        if other.stats is not None:
+            self.stats = merge_edge_stats(self.stats, other.stats.set_axis(remap(other.stats.index.to_numpy())))
+        if other.sketch is not None:
+            self.sketch = merge_edge_sketches(self.sketch, other.sketch.assign(key=remap(other.sketch['key'].to_numpy())))
+        self.tails = pd.concat([ self.tails, other.tails.assign(activity=code_map[other.tails['activity'].to_numpy()].astype(np.int32)) ])
+        return self
+
+    def generalize(self, mapping):
+        # new state for the generalized log (dict activity -> generalized activity; unmapped activities are kept),
+        # derived by remapping & merging edge aggregates and sketches (so, incl. sketch-based medians); see dfg_stats.generalize_dfg
+        # (later updates of the returned state should hold generalized events)
+        labels = self.activities.labels()
+        state = DFGState(self.sorted_by, self.max_open_cases)
+        code_map = state.activities.codes([ mapping.get(label, label) for label in labels ]).astype(np.int64)
+        remap = lambda keys: edge_key(code_map[key_src(keys)], code_map[key_tgt(keys)])
+
+        if self.stats is not None:
+            state.stats = combine_edge_stats(self.stats.set_axis(remap(self.stats.index.to_numpy())))
+        if self.sketch is not None:
+            sketch = self.sketch.assign(key=remap(self.sketch['key'].to_numpy()))
+            state.sketch = sketch.groupby([ 'key', 'bucket' ], sort=True)['count'].sum().reset_index()
+        state.tails = self.tails.assign(activity=code_map[self.tails['activity'].to_numpy()].astype(np.int32))
+        return state
+
+    def metrics(self):
+        # mine_dfg_metrics-compatible dataframe for all events seen so far
+        return stats_to_metrics(self.stats, self.activities.labels(), self.sketch)
+
+    def quantiles(self, q):
+        # estimated q-quantile of durations per edge: dataframe with src, tgt, time_q
+        quant = edge_quantiles(self.sketch, q)
+        labels = self.activities.labels()
+        return pd.DataFrame({ 'src': labels[key_src(quant.index)], 'tgt': labels[key_tgt(quant.index)], f'time_{q}': quant.to_numpy() })
+
+    def num_open_cases(self):
+        return len(self.tails)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+class ActivityVocab:
+    # global activity vocabulary, growing across chunks (label -> code)
+
+    def __init__(self, labels=()):
+        self.code_of = { label: code for code, label in enumerate(labels) }
+
+    def codes(self, labels):
+        return np.array([ self.code_of.setdefault(label, len(self.code_of)) for label in labels ], dtype=np.int32)
+
+    def labels(self):
+        return np.array(list(self.code_of.keys()), dtype=object)
+
+def empty_tails():
+    return pd.DataFrame({ 'activity': pd.Series(dtype=np.int32), 'timestamp': pd.Series(dtype=np.int64) }, index=pd.Index([], dtype=object))
+
+def consume_chunk(chunk, tails, activities, sorted_by='time', max_open_cases=None):
+    """
+    Directly-follows pairs of a chunk of events (EventLog), continuing the open cases in tails.
+
+    Returns
+    -----------------
+    ((src, tgt, dur) arrays of the chunk, new tails)
+    src, tgt: global activity codes; dur: seconds
+    tails: last event (global activity code, timestamp) per open case, indexed by case id
+    """
+
+    # chunk-local activity codes -> global activity codes
+    activ = activities.codes(chunk.activities)[chunk.activity]
+    case = chunk.case
+    ts = chunk.timestamp
+
+    # prepend tails of cases continuing in this chunk
+    pos = pd.Index(chunk.cases).get_indexer(tails.index)
+    cont = pos >= 0
+    if cont.any():
+        case = np.r_[pos[cont].astype(np.int32), case]
+        activ = np.r_[tails['activity'].to_numpy()[cont], activ]
+        ts = np.r_[tails['timestamp'].to_numpy()[cont], ts]
+
+    # (stable: carried event comes first on equal timestamps)
+    order = np.lexsort((ts, case))
+    case, activ, ts = case[order], activ[order], ts[order]
+
+    same_case = case[1:] == case[:-1]
+    edges = (activ[:-1][same_case], activ[1:][same_case], ((ts[1:] - ts[:-1]) / 1e9)[same_case])
+
+    # last event per case in this chunk
+    last = np.flatnonzero(np.r_[~same_case, True]) if len(case) > 0 else np.array([], dtype=np.int64)
+    new_tails = pd.DataFrame({ 'activity': activ[last], 'timestamp': ts[last] }, index=pd.Index(chunk.cases[case[last]], dtype=object))
+
+    if len(chunk) == 0:
+        new_tails = tails
+    elif sorted_by == 'case':
+        # only the case of the chunk's last event may continue in the next chunk
+        new_tails = new_tails.loc[[ chunk.cases[chunk.case[-1]] ]]
+    else:
+        new_tails = pd.concat([ tails.loc[~cont], new_tails ])
+        if max_open_cases is not None and len(new_tails) > max_open_cases:
+            new_tails = new_tails.nlargest(max_open_cases, 'timestamp')
+
+    return edges, new_tails
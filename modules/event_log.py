@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+CASE_KEY = 'case:concept:name'
+ACTIV_KEY = 'concept:name'
+TIME_KEY = 'time:timestamp'
+
+
+class EventLog:
+    """
+    Compact, integer-encoded event log.
+    Keeps one entry per event in three parallel arrays:
+
+    case
+        int32 codes into the `cases` vocabulary
+    activity
+        int32 codes into the `activities` vocabulary
+    timestamp
+        int64 nanoseconds since epoch (UTC)
+
+    Vocabularies are shared by all operations on the log (filtering, sorting, abstraction),
+    so groupbys, isin checks and joins work on integers instead of strings.
+    """
+
+    def __init__(self, case, activity, timestamp, cases, activities, tz=None):
+        self.case = np.asarray(case, dtype=np.int32)
+        self.activity = np.asarray(activity, dtype=np.int32)
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.cases = np.asarray(cases, dtype=object)
+        self.activities = np.asarray(activities, dtype=object)
+        # timezone of the original timestamps (None = tz-naive)
+        self.tz = tz
+
+    @classmethod
+    def from_df(cls, df):
+        case_codes, cases = _encode(df[CASE_KEY], to_str=True)
+        activ_codes, activities = _encode(df[ACTIV_KEY])
+
+        timestamps = pd.to_datetime(df[TIME_KEY])
+        tz = timestamps.dt.tz
+        if tz is not None:
+            timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+
+        return cls(case_codes, activ_codes, timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64), cases, activities, tz=tz)
+
+    def to_df(self):
+        timestamps = pd.to_datetime(self.timestamp, unit='ns')
+        if self.tz is not None:
+            timestamps = timestamps.tz_localize('UTC').tz_convert(self.tz)
+
+        return pd.DataFrame({
+            CASE_KEY: pd.array(self.cases[self.case], dtype='string'),
+            ACTIV_KEY: self.activities[self.activity],
+            TIME_KEY: timestamps
+        })
+
+    def __len__(self):
+        return len(self.case)
+
+    def __repr__(self):
+        return f"EventLog(# events = {len(self)}, # cases = {self.num_cases()}, # activities = {len(self.activities)})"
+
+    def num_cases(self):
+        return len(np.unique(self.case))
+
+    def activity_code(self, label):
+        # code of given activity label; added to the vocabulary if not yet known
+        found = np.flatnonzero(self.activities == label)
+        if len(found) > 0:
+            return int(found[0])
+
+        self.activities = np.append(self.activities, np.array([ label ], dtype=object))
+        return len(self.activities) - 1
+
+    def activity_codes(self, labels):
+        # codes of given activity labels (unknown labels are ignored)
+        return np.flatnonzero(np.isin(self.activities, list(labels))).astype(np.int32)
+
+    def case_codes(self, cases):
+        # codes of given case ids (unknown case ids are ignored)
+        return np.flatnonzero(np.isin(self.cases, np.asarray(cases).astype(str))).astype(np.int32)
+
+    def take(self, sel):
+        # new log with the selected events (boolean mask or positions); vocabularies are kept
+        return EventLog(self.case[sel], self.activity[sel], self.timestamp[sel], self.cases, self.activities, tz=self.tz)
+
+    def copy(self):
+        return EventLog(self.case.copy(), self.activity.copy(), self.timestamp.copy(), self.cases, self.activities.copy(), tz=self.tz)
+
+    def keep(self, mask):
+        # in-place version of take (cfr. DataFrame.drop(..., inplace=True))
+        self.case = self.case[mask]
+        self.activity = self.activity[mask]
+        self.timestamp = self.timestamp[mask]
+
+    def filter_cases(self, cases):
+        return self.take(np.isin(self.case, self.case_codes(cases)))
+
+    def sort_order(self):
+        # stable; events with equal timestamps keep their original order (as in pm4py)
+        return np.lexsort((self.timestamp, self.case))
+
+    def sort(self):
+        return self.take(self.sort_order())
+
+    def is_sorted(self):
+        if len(self) < 2:
+            return True
+        same_case = self.case[1:] == self.case[:-1]
+        return bool(np.all(self.case[1:] >= self.case[:-1]) and np.all(self.timestamp[1:][same_case] >= self.timestamp[:-1][same_case]))
+
+    def directly_follows(self):
+        # (src, tgt, duration in ns) code arrays for all directly-follows pairs within cases
+        log = self if self.is_sorted() else self.sort()
+
+        same_case = log.case[1:] == log.case[:-1]
+        src = log.activity[:-1][same_case]
+        tgt = log.activity[1:][same_case]
+        dur = (log.timestamp[1:] - log.timestamp[:-1])[same_case]
+
+        return src, tgt, dur
+
+    def dfg(self):
+        # pm4py-style frequency DFG: { (src, tgt): freq }
+        src, tgt, _ = self.directly_follows()
+        num_activ = len(self.activities)
+        keys, counts = np.unique(src.astype(np.int64) * num_activ + tgt, return_counts=True)
+
+        return { (self.activities[key // num_activ], self.activities[key % num_activ]): int(count) for key, count in zip(keys, counts) }
+
+    def activity_counts(self):
+        counts = np.bincount(self.activity, minlength=len(self.activities))
+        return { self.activities[code]: int(count) for code, count in enumerate(counts) if count > 0 }
+
+    def variants(self):
+        # { activity sequence (tuple): # cases }
+        log = self if self.is_sorted() else self.sort()
+        if len(log) == 0:
+            return {}
+
+        starts = np.flatnonzero(np.r_[True, log.case[1:] != log.case[:-1]])
+        seqs = np.split(log.activity, starts[1:])
+
+        # count on raw code bytes; only decode each unique sequence once
+        counts = {}
+        for seq in seqs:
+            key = seq.tobytes()
+            counts[key] = counts.get(key, 0) + 1
+
+        return { tuple(self.activities[np.frombuffer(key, dtype=np.int32)]): count for key, count in counts.items() }
+
+
+def _encode(sr, to_str=False):
+    # (codes, vocabulary); categorical columns (e.g., read_csv with dtype='category') are not expanded into strings
+    if isinstance(sr.dtype, pd.CategoricalDtype):
+        sr = sr.cat.remove_unused_categories()
+        vocab = sr.cat.categories
+        codes = sr.cat.codes.to_numpy()
+    else:
+        codes, vocab = pd.factorize(sr, sort=True)
+    if to_str:
+        vocab = vocab.astype(str)
+
+    return codes, vocab.to_numpy(dtype=object)
+
+LOG_KEYS = [ CASE_KEY, ACTIV_KEY, TIME_KEY ]
+
+def is_parquet(path):
+    return str(path).endswith(( '.parquet', '.pq' ))
+
+def read_event_log(path, chunksize=None, cases=None):
+    # only case, activity and timestamp columns; labels are read as categoricals,
+    # so each distinct case id / activity label is only kept once
+    # cases: (optional) only read events of these cases
+    if is_parquet(path):
+        if chunksize is None:
+            return EventLog.from_df(read_parquet_log(path, cases=cases))
+        return ( EventLog.from_df(batch) for batch in __parquet_batches(path, chunksize, cases) )
+
+    if chunksize is None and cases is not None:
+        from .case_index import has_case_index, read_cases
+        if has_case_index(path):
+            return EventLog.from_df(read_cases(path, cases))
+
+    read = pd.read_csv(path, usecols=LOG_KEYS, chunksize=chunksize, dtype={ CASE_KEY: 'category', ACTIV_KEY: 'category' })
+    if chunksize is None:
+        log = EventLog.from_df(read)
+        return log.filter_cases(cases) if cases is not None else log
+    # (iterator over EventLogs with chunk-local vocabularies)
+    return ( __filter_chunk(EventLog.from_df(chunk), cases) for chunk in read )
+
+def read_parquet_log(path, attrs=None, cases=None):
+    """
+    Read a (columnar) Parquet log, as written by mine_utils.convert_log.
+    Only case, activity and timestamp columns plus the given attributes are loaded (projection pushdown),
+    and only events of the given cases (predicate pushdown; most effective if the log is sorted on case).
+    Timestamps are stored typed, so they are not re-parsed.
+    """
+
+    import pyarrow.parquet as pq
+
+    filters = [ (CASE_KEY, 'in', [ str(case) for case in cases ]) ] if cases is not None else None
+    table = pq.read_table(path, columns=[ *LOG_KEYS, *(attrs or []) ], filters=filters, read_dictionary=[ CASE_KEY, ACTIV_KEY ])
+
+    return table.to_pandas()
+
+def __parquet_batches(path, chunksize, cases):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=LOG_KEYS):
+        chunk = batch.to_pandas()
+        yield chunk if cases is None else chunk.loc[chunk[CASE_KEY].astype(str).isin([ str(case) for case in cases ])]
+
+def __filter_chunk(log, cases):
+    return log.filter_cases(cases) if cases is not None else log
+
+def as_event_log(log):
+    return log if isinstance(log, EventLog) else EventLog.from_df(log)
+
+def as_df(log):
+    return log.to_df() if isinstance(log, EventLog) else log
@@ -1,5 +1,11 @@
 import re
 import graphviz
+import xml.etree.ElementTree as ET
+
+SVG_NS = "http://www.w3.org/2000/svg"
+# (serialize without ns0: prefixes)
+ET.register_namespace('', SVG_NS)
+ET.register_namespace('xlink', "http://www.w3.org/1999/xlink")
 
 class EditableDiGraph:
     
@@ -47,6 +53,49 @@ class EditableDiGraph:
     def to_gviz(self):
         return graphviz.Source(self.to_dot(), format='png')
 
+class HighlightOverlay:
+    """
+    Lays out & renders an EditableDiGraph once (as SVG), and highlights nodes by recolouring
+    their shapes in the rendered SVG, so Graphviz doesn't run again per highlight.
+    Rendered images are memoized per set of highlighted nodes.
+
+    Parameters
+    -----------------
+    graph
+        EditableDiGraph
+    color
+        fill (and outline) colour of highlighted nodes
+    """
+
+    def __init__(self, graph, color='lightpink'):
+        self.graph = graph
+        self.color = color
+        self.__svg = None
+        self.__rendered = {}
+
+    def render(self, labels):
+        # SVG (str) with the nodes of given labels highlighted (unknown labels are ignored)
+        key = frozenset(label for label in labels if label in self.graph.label_node)
+        if key not in self.__rendered:
+            self.__rendered[key] = self.__highlight(key)
+        return self.__rendered[key]
+
+    def __highlight(self, labels):
+        if self.__svg is None:
+            self.__svg = graphviz.Source(self.graph.to_dot(), format='svg').pipe(encoding='utf-8')
+        root = ET.fromstring(self.__svg)
+
+        node_ids = { self.graph.label_node[label]['__id'].strip('"') for label in labels }
+        for group in root.iter(f"{{{SVG_NS}}}g"):
+            if group.get('class') != 'node' or group.findtext(f"{{{SVG_NS}}}title") not in node_ids:
+                continue
+            for shape in group:
+                if shape.tag in ( f"{{{SVG_NS}}}polygon", f"{{{SVG_NS}}}ellipse", f"{{{SVG_NS}}}path" ):
+                    shape.set('fill', self.color)
+                    shape.set('stroke', self.color)
+
+        return ET.tostring(root, encoding='unicode')
+
 # test        
 # bpmn = pm4py.read_bpmn("data/norm.bpmn")
 # bpmn_gviz = bpmn_visualizer.apply(bpmn)
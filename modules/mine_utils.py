@@ -24,26 +24,213 @@ from pm4py.visualization.process_tree import visualizer as pt_visualizer
 from pm4py.objects.conversion.process_tree import converter as pt_converter
 
 # custom code
-from .abstract_events import aggregate_events, generalize_events
+from .abstract_events import aggregate_events, generalize_events, abstract_log
+from .event_log import EventLog, LOG_KEYS, read_event_log, read_parquet_log, is_parquet
+from .dfg_stream import DFGState
+from .case_index import has_case_index, read_cases
 
 import numpy as np
 import pandas as pd
 import os
 
-def read_log(path):
-    log = pd.read_csv(path)
+# path: CSV log, or Parquet log (see convert_log)
+# encoded: return a compact EventLog (only case, activity and timestamp columns)
+# attrs: (Parquet) extra attributes to load; CSV logs are loaded with all attributes, unless attrs is given
+# cases: only load events of these cases (Parquet: filtered at read time; indexed CSV: read directly, see case_index)
+def read_log(path, encoded=False, attrs=None, cases=None):
+    if encoded:
+        return read_event_log(path, cases=cases)
+
+    if is_parquet(path):
+        log = read_parquet_log(path, attrs, cases)
+        log['case:concept:name'] = log['case:concept:name'].astype('string')
+        # (same as CSV logs; plain activity labels)
+        log['concept:name'] = log['concept:name'].astype(object)
+        # (timestamps are stored typed)
+        return log
+
+    if cases is not None and has_case_index(path):
+        # (seek directly to the cases' events; see case_index.build_case_index)
+        log = read_cases(path, cases)
+        if attrs is not None:
+            log = log[[ *LOG_KEYS, *attrs ]]
+    else:
+        log = pd.read_csv(path, usecols=([ *LOG_KEYS, *attrs ] if attrs is not None else None))
+        if cases is not None:
+            log = log.loc[log['case:concept:name'].astype(str).isin([ str(case) for case in cases ]),].copy()
     log['case:concept:name'] = log['case:concept:name'].astype('string')
     log['time:timestamp'] = pd.to_datetime(log['time:timestamp'])
     return log
 
-def read_sub_log(name, select, path):
-    log = pd.read_csv(os.path.join(path, "event logs", name))
+def read_sub_log(name, select, path, encoded=False, attrs=None):
     select_cases = pd.read_csv(os.path.join(path, select))
+    log_path = os.path.join(path, "event logs", name)
+    if encoded or is_parquet(log_path) or has_case_index(log_path):
+        return read_log(log_path, encoded, attrs, cases=select_cases['UniqueId'])
+
+    log = pd.read_csv(log_path)
     log = log.loc[log['case:concept:name'].isin(select_cases['UniqueId']),]
     log['case:concept:name'] = log['case:concept:name'].astype('string')
     log['time:timestamp'] = pd.to_datetime(log['time:timestamp'])
     return log
 
+def read_sub_logs(name, selects, path, encoded=False, mine=False, keep_logs=True, chunksize=1000000):
+    # batch version of read_sub_log: all sub-logs (group -> selection file) in a single scan of the log
+    case_groups = pd.concat([ pd.DataFrame({ 'case': pd.read_csv(os.path.join(path, select))['UniqueId'], 'group': group })
+                              for group, select in selects.items() ], ignore_index=True)
+
+    return split_log(os.path.join(path, "event logs", name), case_groups, encoded, mine, keep_logs, chunksize)
+
+def split_log(path, case_groups, encoded=False, mine=False, keep_logs=True, chunksize=1000000):
+    """
+    Partition a log into sub-logs in a single (chunked) scan of the log.
+
+    Parameters
+    -----------------
+    path
+        path of CSV or Parquet log
+    case_groups
+        case -> group mapping: dict (group or list of groups per case) or dataframe with 'case' and 'group' columns;
+        a case may belong to several groups
+    encoded
+        return sub-logs as EventLogs (only case, activity and timestamp columns)
+    mine
+        also mine each sub-log's DFG metrics during the same pass (see dfg_stream.DFGState);
+        requires a log sorted on case or on time
+    keep_logs
+        if False, only the DFG metrics are returned (sub-logs are not kept in memory)
+
+    Returns
+    -----------------
+    dict group -> sub-log; if mine, (dict group -> sub-log, dict group -> DFG metrics)
+    """
+
+    case_groups = __case_groups_df(case_groups)
+    groups = list(pd.unique(case_groups['group']))
+
+    parts = { group: [] for group in groups }
+    states = { group: DFGState() for group in groups } if mine else None
+    for chunk in __log_chunks(path, chunksize, encoded):
+        # each event joined with the group(s) of its case
+        chunk = chunk.assign(__case=chunk['case:concept:name'].astype(str).to_numpy())
+        chunk = chunk.merge(case_groups, left_on='__case', right_on='case', how='inner', sort=False).drop(columns=[ '__case', 'case' ])
+
+        for group, part in chunk.groupby('group', sort=False):
+            part = part.drop(columns='group')
+            if keep_logs:
+                parts[group].append(part)
+            if mine:
+                states[group].update(part)
+
+    sub_logs = { group: __concat_sub_log(parts[group], encoded) for group in groups } if keep_logs else None
+    if mine:
+        dfgs = { group: states[group].metrics() for group in groups }
+        return (sub_logs, dfgs) if keep_logs else dfgs
+
+    return sub_logs
+
+def __case_groups_df(case_groups):
+    if isinstance(case_groups, dict):
+        case_groups = pd.DataFrame([ [ case, group ] for case, case_group in case_groups.items()
+                                     for group in (case_group if isinstance(case_group, (list, tuple, set)) else [ case_group ]) ],
+                                   columns=[ 'case', 'group' ])
+    case_groups = case_groups[[ 'case', 'group' ]].drop_duplicates()
+
+    return case_groups.assign(case=case_groups['case'].astype(str))
+
+def __log_chunks(path, chunksize, encoded):
+    columns = LOG_KEYS if encoded else None
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+def __concat_sub_log(parts, encoded):
+    log = pd.concat(parts, ignore_index=True) if len(parts) > 0 else pd.DataFrame(columns=LOG_KEYS)
+    log['case:concept:name'] = log['case:concept:name'].astype('string')
+    log['time:timestamp'] = pd.to_datetime(log['time:timestamp'])
+
+    return EventLog.from_df(log) if encoded else log
+
+def convert_log(csv_path, parquet_path=None, chunksize=1000000):
+    """
+    One-time conversion of a CSV log (export) into a columnar Parquet log.
+    Converts in chunks, so the CSV log does not need to fit in memory.
+    Case ids are stored as strings, activities dictionary-encoded and timestamps typed.
+    Types of other attributes are inferred over all chunks (first pass), so all chunks share one schema:
+    integer attributes with missing values are stored as floats, and only attributes with mixed
+    (or no) values are stored as strings.
+
+    Returns
+    -----------------
+    path of Parquet log (default: CSV path with .parquet extension)
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if parquet_path is None:
+        parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+
+    dtypes = __infer_csv_dtypes(csv_path, chunksize)
+
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=dtypes):
+            chunk['time:timestamp'] = pd.to_datetime(chunk['time:timestamp'])
+            if writer is None:
+                schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+                writer = pq.ParquetWriter(parquet_path, schema, use_dictionary=[ 'case:concept:name', 'concept:name' ])
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return parquet_path
+
+def __infer_csv_dtypes(csv_path, chunksize):
+    # per column, dtype that fits all chunks (pandas infers per chunk; e.g., an attribute empty in one chunk is float there)
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = { 'case:concept:name': str, 'concept:name': str }
+    attributes = [ column for column in columns if column not in dtypes and column != 'time:timestamp' ]
+    if len(attributes) == 0:
+        return dtypes
+
+    # kind: 'i' (int), 'f' (float), 'b' (bool), 'O' (other: string); None while only missing values seen
+    kinds = { column: None for column in attributes }
+    missing = { column: False for column in attributes }
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, usecols=attributes):
+        for column in attributes:
+            values = chunk[column]
+            is_na = values.isna()
+            missing[column] = missing[column] or bool(is_na.any())
+            if is_na.all():
+                continue
+
+            kind = values.dtype.kind if values.dtype.kind in 'ifb' else 'O'
+            if kinds[column] is None or kinds[column] == kind:
+                kinds[column] = kind
+            elif { kinds[column], kind } == { 'i', 'f' }:
+                kinds[column] = 'f'
+            else:
+                # (mixed)
+                kinds[column] = 'O'
+
+    for column in attributes:
+        kind = kinds[column]
+        if kind == 'i':
+            dtypes[column] = 'float64' if missing[column] else 'int64'
+        elif kind == 'f':
+            dtypes[column] = 'float64'
+        elif kind == 'b':
+            dtypes[column] = 'boolean' if missing[column] else 'bool'
+        else:
+            dtypes[column] = str
+
+    return dtypes
+
 # (got idea from clean_dfg_based_on_noise_thresh)
 def clean_dfg_infreq_edges(dfg, geq):
     new_dfg = None
@@ -56,16 +243,29 @@ def clean_dfg_infreq_edges(dfg, geq):
             
     return new_dfg
 
-def mine_dfg(log, noise_threshold=0, edge_freq=1):
-    dfg = dfg_discovery.apply(log)
-    
-    all_activ = log['concept:name'].unique()
-    dfg = clean_dfg_based_on_noise_thresh(dfg, all_activ, noise_threshold)
-    
-    if edge_freq > 1:
-        dfg = clean_dfg_infreq_edges(dfg, edge_freq)
+# log: dataframe, EventLog or path of CSV log
+# cache: (path only) DFGCache; reuses the DFG mined earlier from the same log content with the same parameters
+# rules: abstraction rules applied before mining (see abstract_events.abstract_log)
+def mine_dfg(log, noise_threshold=0, edge_freq=1, cache=None, rules=None):
+    if isinstance(log, str) and cache is not None:
+        params = { 'noise_threshold': noise_threshold, 'edge_freq': edge_freq, 'rules': rules }
+        dfg_key, activ_key = cache.key(log, kind='dfg', **params), cache.key(log, kind='activity_counts', **params)
+        dfg_df, activ_df = cache.get(dfg_key), cache.get(activ_key)
+
+        if dfg_df is None or activ_df is None:
+            dfg, activ_count, _ = __mine_dfg_dict(read_log(log, encoded=True), noise_threshold, edge_freq, rules)
+            cache.put(dfg_key, pd.DataFrame([ [ key[0], key[1], value ] for key, value in (dfg or {}).items() ], columns=[ 'src', 'tgt', 'freq' ]))
+            cache.put(activ_key, pd.DataFrame({ 'activity': list(activ_count.keys()), 'count': list(activ_count.values()) }))
+        else:
+            dfg = { (src, tgt): int(freq) for src, tgt, freq in dfg_df.itertuples(index=False) }
+            activ_count = { activ: int(count) for activ, count in activ_df.itertuples(index=False) }
+        vis_log = None
+    else:
+        if isinstance(log, str):
+            log = read_log(log, encoded=True)
+        dfg, activ_count, vis_log = __mine_dfg_dict(log, noise_threshold, edge_freq, rules)
     
-    gviz = dfg_visualizer.apply(dfg, log=log, 
+    gviz = dfg_visualizer.apply(dfg, log=vis_log, activities_count=activ_count, 
 #                                variant=dfg_visualizer.Variants.PERFORMANCE, 
 #                                parameters={ 'pm4py:param:start_timestamp_key': 'time:timestamp',
 #                                             'pm4py:param:timestamp_key': 'time:timestamp'}
@@ -76,6 +276,29 @@ def mine_dfg(log, noise_threshold=0, edge_freq=1):
     
     return dfg
 
+def __mine_dfg_dict(log, noise_threshold, edge_freq, rules):
+    if rules is not None and len(rules) > 0:
+        log = abstract_log(log.copy(), rules)
+
+    if isinstance(log, EventLog):
+        dfg = log.dfg()
+        activ_count = log.activity_counts()
+        all_activ = list(activ_count.keys())
+        # (visualizer only needs the activity counts)
+        vis_log = None
+    else:
+        dfg = dfg_discovery.apply(log)
+        activ_count = None
+        all_activ = log['concept:name'].unique()
+        vis_log = log
+    
+    dfg = clean_dfg_based_on_noise_thresh(dfg, all_activ, noise_threshold)
+    
+    if edge_freq > 1:
+        dfg = clean_dfg_infreq_edges(dfg, edge_freq)
+
+    return dfg, activ_count, vis_log
+
 def mine_pnet_alpha(log):
     net, initial_marking, final_marking = alpha_miner.apply(log)
     gviz = pn_visualizer.apply(net, initial_marking, final_marking)
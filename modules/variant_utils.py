@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pm4py
 from collections import Counter
@@ -7,9 +8,16 @@ from collections_extended import frozenbag
 # from pm4py.objects.conversion.log.variants import to_data_frame
 
 from pm4py.objects.log.obj import Trace
+from .event_log import EventLog
+
+def __variants(log):
+    return log.variants() if isinstance(log, EventLog) else pm4py.get_variants(log)
+
+def __num_cases(log):
+    return log.num_cases() if isinstance(log, EventLog) else len(log['case:concept:name'].unique())
 
 def get_variants(log):
-    variants = pm4py.get_variants(log)
+    variants = __variants(log)
     variants = list(variants.keys())
     # print("variants", variants)
     # print("# unique variants:", len(variants))
@@ -36,7 +44,7 @@ def get_variants(log):
 #         return variants
 
 def get_variant_ratio(log, vars_stats, print_summ=True):
-    num_traces = len(log['case:concept:name'].unique())
+    num_traces = __num_cases(log)
     num_vars = vars_stats.shape[0]
     var_ratio = round((num_vars / num_traces) * 100, 2)
     if print_summ:
@@ -44,9 +52,9 @@ def get_variant_ratio(log, vars_stats, print_summ=True):
     return var_ratio
 
 def get_variants_stats(log):
-    variants = pm4py.get_variants(log)
+    variants = __variants(log)
     variants = pd.DataFrame(variants.items())
-    num_seq = len(log['case:concept:name'].unique())
+    num_seq = __num_cases(log)
     num_var = variants.shape[0]
     
     variants.columns = ['sequence', 'cov_amt']
@@ -96,6 +104,9 @@ def get_x_coverage(perc, cmp_col, ret_col, vars_stats):
     
     
 def filter_traces_on_variants(log, variants):
+    if isinstance(log, EventLog):
+        return __filter_traces_on_variants_enc(log, variants)
+
     traces = log.groupby('case:concept:name')['concept:name'].apply(tuple).rename('sequence').reset_index()
     # add case's sequence to all events of that case
     merged_log = log.merge(traces) # will merge on case:concept:name
@@ -106,6 +117,18 @@ def filter_traces_on_variants(log, variants):
     
     return filtered_log
 
+def __filter_traces_on_variants_enc(log, variants):
+    sorted_log = log.sort()
+    starts = np.flatnonzero(np.r_[True, sorted_log.case[1:] != sorted_log.case[:-1]])
+    seqs = np.split(sorted_log.activity, starts[1:])
+
+    # compare code sequences instead of label tuples
+    code_of = { activ: code for code, activ in enumerate(log.activities) }
+    keep_seqs = set( tuple(code_of.get(activ, -1) for activ in seq) for seq in variants['sequence'] )
+    keep_cases = [ sorted_log.case[start] for start, seq in zip(starts, seqs) if tuple(seq.tolist()) in keep_seqs ]
+
+    return log.take(np.isin(log.case, keep_cases))
+
 
 class Variant:
     